@@ -1,15 +1,19 @@
 from alara.stt.whisper_stt import StreamHandler
 from alara.stt.wakeword import WakeWord
-from alara.nlp.intent_recognition import IntentRecognition
+from alara.stt.audio_capture import AudioCapture
+from alara.nlp.intent_engine import IntentEngine
+from alara.nlp.intent_cache import IntentCache
+from alara.config.config import cfg
 from alara.lib.singleton import Singleton
 from alara.tts.tts_engine import TTSEngine
 from alara.llm.llm_engine import LlmEngine
 from alara.automation.automation_handler import AutomationHandler
-from alara.skills.skill_manager import SkillManager
+from alara.skills.skill_manager import SkillManager, Skill
 from alara.automation.event import Event, State
 from alara.lib.logger import Logger
-from alara.llm.grammar.pydantic_models_to_grammar import generate_gbnf_grammar_and_documentation, \
-    create_dynamic_model_from_function
+from alara.llm.grammar.grammar_registry import GrammarRegistry
+from alara.lib.cancellation import CancellationToken, OperationCancelled
+from alara.tools.memory.chroma.memory_compaction import MemoryCompactor
 import json
 import time
 
@@ -20,14 +24,24 @@ import time
 class Agent(metaclass=Singleton):
 
     def __init__(self):
+        # load the shared models before the preloaded skills ask for them from the pool threads
         self.tts = TTSEngine.load_tts()
-        self.skill_manager = SkillManager()
+        self.llm = LlmEngine.load_llm()
+        self.skill_manager = SkillManager(preload_workers=cfg.SKILL_PRELOAD_WORKERS)
+        self.skill_manager.preload_skills(cfg.SKILL_PRELOAD)
         self.automation_handler = AutomationHandler(skill_manager=self.skill_manager)
         self.stream_handler = StreamHandler()
         self.wake_word = WakeWord()
-        self.intent_recognition = IntentRecognition(skill_manager=self.skill_manager)
+        self.intent_recognition = IntentEngine.load_intent_recognition(skill_manager=self.skill_manager)
+        self.intent_cache = IntentCache(embed=getattr(self.intent_recognition, "embed", None)
+                                        if cfg.INTENT_CACHE_SIMILARITY else None)
+        self.skill_manager.add_listener(self.intent_cache.invalidate_skill)
         self.system_prompt = "Your name is Alara. You are an AI assistant that helps people with their daily tasks."
-        self.llm = LlmEngine.load_llm()
+        self.grammar_registry = GrammarRegistry()
+        self.skill_manager.add_listener(self.grammar_registry.invalidate)
+        self.begin_turn()
+        if cfg.MEMORY_COMPACTION_INTERVAL > 0:
+            MemoryCompactor().schedule()
         self.running = True
         
         self.last_interaction = None
@@ -37,51 +51,114 @@ class Agent(metaclass=Singleton):
         self.agent_state = self.automation_handler.state_machine.add_state(
             State(entity_id=self.agent_name, state="idle", attributes={"last_interaction": None}))
     
+    def begin_turn(self) -> CancellationToken:
+        """Start a turn with a fresh cancellation token, shared by LLM generation and speech synthesis.
+        Returns:
+            CancellationToken: The token of the turn."""
+        self.cancel_token = CancellationToken()
+        self.tts.cancel_token = self.cancel_token
+        self.llm.cancel_token = self.cancel_token
+        return self.cancel_token
+
+    def interrupt(self):
+        """Stop the LLM generation and the speech of the current turn, eg. when the user barges in."""
+        self.logger.info("Interrupting the current turn.")
+        self.cancel_token.cancel()
+
+    def resolve_prompt(self, user_prompt: str) -> tuple[str, Skill, dict, bool]:
+        """Route a prompt to a skill and generate its function call.
+        Args:
+            user_prompt: str: The transcribed prompt.
+        Returns:
+            tuple: The intent, the skill, the function call and whether it was served from the intent cache."""
+        cached = self.intent_cache.get(user_prompt)
+        if cached is not None:
+            intent, params = cached
+            return intent, self.skill_manager.load_skill(intent), params, True
+        intent = self.intent_recognition.get_intent(user_prompt)
+        skill = self.skill_manager.load_skill(intent)
+        function_grammar = self.grammar_registry.get_function_grammar(
+            intent, list(skill.bound_features.values()))
+        system_prompt = f"""You are an advanced AI assistant tasked with generating JSON objects. These objects represent function calls that you can make to fulfill the user's request. Given a prompt, extract the relevant information and call a function. Should the prompt not contain enough information to call a function, use the default values. Below is a list of your available function calls, only one function can be called at a time so choose wisely:\n\n{function_grammar.documentation}"""
+        output = self.llm.chat_completion(system_prompt=system_prompt, user_prompt=user_prompt,
+                                          grammar=function_grammar.grammar)
+        return intent, skill, json.loads(output), False
+
+    def call_skill(self, user_prompt: str, intent: str, skill: Skill, params: dict, cached: bool):
+        """Call the feature chosen for a prompt.
+        Args:
+            user_prompt: str: The transcribed prompt.
+            intent: str: The skill the prompt was routed to.
+            skill: Skill: The skill.
+            params: dict: The function call, eg. {"function": ..., "params": {...}}.
+            cached: bool: Whether the function call was served from the intent cache."""
+        result = skill.call_feature(params['function'], **params['params'])
+        if not cached:
+            self.intent_cache.put(user_prompt, intent, params)
+        return result
+
+    def notify_error(self, error: Exception):
+        """Tell the user that a prompt could not be handled.
+        Args:
+            error: Exception: The error raised while handling the prompt."""
+        self.logger.error(f"Error calling skill: {error}")
+        try:
+            self.tts.synthesize_stream(self.llm.stream_chat_completion(
+                system_prompt=self.system_prompt,
+                user_prompt="Notify the user that the feature they asked for has not been implemented yet."))
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            self.logger.error(f"Failed to notify the user of the error: {e}")
+
     def process_user_prompt(self, user_prompt):
         self.logger.debug(f"User prompt: {user_prompt}")
         self.automation_handler.state_machine.set_state(entity_id=self.agent_name, new_state="processing",
                                                         attributes={"last_interaction": self.last_interaction})
-        intent = self.intent_recognition.get_intent(user_prompt)
         try:
-            skill = self.automation_handler.skill_manager.load_skill(intent)
-            features = skill.get_features()
-            models = [create_dynamic_model_from_function(getattr(skill, feature)) for feature in features]
-            gbnf, documentation = generate_gbnf_grammar_and_documentation(
-                pydantic_model_list=models, outer_object_name="function",
-                outer_object_content="params", model_prefix="Function", fields_prefix="Parameters"
-            )
-            system_prompt = f"""You are an advanced AI assistant tasked with generating JSON objects. These objects represent function calls that you can make to fulfill the user's request. Given a prompt, extract the relevant information and call a function. Should the prompt not contain enough information to call a function, use the default values. Below is a list of your available function calls, only one function can be called at a time so choose wisely:\n\n{documentation}"""
-            output = self.llm.chat_completion(system_prompt=system_prompt, user_prompt=user_prompt, grammar=gbnf)
-            params = json.loads(output)
-            function = getattr(skill, params['function'])
-            return function(**params['params'])
+            return self.call_skill(user_prompt, *self.resolve_prompt(user_prompt))
+        except OperationCancelled:
+            self.logger.info(f"Abandoned prompt '{user_prompt}'")
         except Exception as e:
-            self.logger.error(f"Error calling skill: {e}")
-            output = self.llm.chat_completion(system_prompt=self.system_prompt,
-                                              user_prompt=f"Notify the user that the feature {function} has not"
-                                                          f"been implemented yet.")
-            self.tts.synthesize(output)
+            self.notify_error(e)
         self.last_interaction = time.time()
-        
-    def handle_wakeword(self):
+
+    def on_wakeword(self):
+        """Record the interaction and announce that the agent is listening."""
         self.last_interaction = time.time()
         self.logger.info("Wakeword detected.")
         self.automation_handler.event_bus.emit_event(Event("wakeword_detected", {"agent_name": self.agent_name}))
         self.automation_handler.state_machine.set_state(entity_id=self.agent_name, new_state="listening",
                                                         attributes={"last_interaction": self.last_interaction})
-        self.tts.synthesize("How can I help you?")
-        user_prompt = self.stream_handler.listen()
+
+    def on_idle(self):
+        """Announce that the conversation is over."""
+        self.automation_handler.event_bus.emit_event(Event("idle", {"agent_name": self.agent_name}))
+        self.automation_handler.state_machine.set_state(entity_id=self.agent_name, new_state="idle",
+                                                        attributes={"last_interaction": None})
+        self.last_interaction = None
+
+    def handle_wakeword(self):
+        self.begin_turn()
+        self.on_wakeword()
+        speaking_from = AudioCapture().position
+        try:
+            self.tts.synthesize("How can I help you?")
+        except Exception as e:
+            self.logger.error(f"Failed to speak the greeting: {e}")
+        # include speech that followed the wake word, but not the prompt picked up by the microphone
+        user_prompt = self.stream_handler.listen(start_position=self.wake_word.detected_position,
+                                                 muted=(speaking_from, AudioCapture().position))
         if user_prompt:
             self.process_user_prompt(user_prompt)
         self.wake_word.clear_wakeword_buffer()
 
     def run(self):
+        """Run the agent in a single blocking loop.
+        The wakeword is only detected between turns, so this loop cannot barge in, use AgentRuntime for that."""
         while self.running:
             if self.last_interaction is not None and time.time() - self.last_interaction > 10:
-                self.automation_handler.event_bus.emit_event(Event("idle", {"agent_name": self.agent_name}))
-                self.automation_handler.state_machine.set_state(entity_id=self.agent_name, new_state="idle",
-                                                                attributes={"last_interaction": None})
-                self.last_interaction = None
+                self.on_idle()
             if self.last_interaction is not None:
                 user_prompt = self.stream_handler.listen()
                 if user_prompt:
@@ -92,4 +169,8 @@ class Agent(metaclass=Singleton):
 
     def stop(self):
         self.running = False
+        self.wake_word.stop()
+        self.stream_handler.stop_listening()
+        AudioCapture().stop()
+        self.skill_manager.shutdown()
         print("Agent stopped.")
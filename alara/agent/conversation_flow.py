@@ -2,11 +2,12 @@
 from llama_cpp import Llama, LlamaGrammar
 from pydantic import BaseModel, Field
 from enum import Enum
-from alara.llm.grammar.pydantic_models_to_grammar import generate_gbnf_grammar_and_documentation, \
-    generate_gbnf_grammar_from_pydantic_models
+from concurrent.futures import ThreadPoolExecutor
+from alara.llm.grammar.pydantic_models_to_grammar import generate_gbnf_grammar_and_documentation_cached
 from alara.nlp.intent_recognition import IntentRecognition
 from alara.skills.skill_manager import SkillManager
-from alara.tools.memory.chroma.chroma import SearchMemoryTool, AddMemoryTool, Memory
+from alara.tools.memory.chroma.chroma import SearchMemoryTool, AddMemoryTool, Memory, MemoryType as StoredMemoryType
+from alara.tools.memory.chroma.memory_writer import MemoryWriter
 import json
 
 
@@ -20,7 +21,7 @@ class InputTypeResponse(BaseModel):
     # reason: str = Field(..., description='The reason why the input is classified as conversational or task-oriented')
 
 
-gbnf = generate_gbnf_grammar_from_pydantic_models([InputTypeResponse])
+gbnf, _ = generate_gbnf_grammar_and_documentation_cached([InputTypeResponse])
 input_type_grammar = LlamaGrammar.from_string(gbnf)
 
 
@@ -42,7 +43,18 @@ class MemoryType(str, Enum):
     DIALOGUE = 'dialogue'
 
 
+conversational_gbnf, _ = generate_gbnf_grammar_and_documentation_cached([ConversationalResponse])
+conversational_grammar = LlamaGrammar.from_string(conversational_gbnf)
+memory_gbnf, _ = generate_gbnf_grammar_and_documentation_cached([Memory])
+memory_grammar = LlamaGrammar.from_string(memory_gbnf)
+
+
 llm = Llama(model_path='C:/Users/avity/Projects/models/stablelm-zephyr-3b.Q4_K_M.gguf', n_ctx=1024)
+# Runs the input-type LLM call, intent recognition and memory retrieval of a turn concurrently.
+executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="conversation-flow")
+# Built once, so a turn does not rediscover the skills or reload the intent model.
+skill_manager = SkillManager()
+intent_recognition = IntentRecognition(skill_manager=skill_manager)
 
 
 def input_type_prompt(input_text: str):
@@ -84,18 +96,25 @@ def input_type_prompt(input_text: str):
     return InputTypeResponse(**json_output)
 
 
-def conversational_prompt(input_text: str):
+def search_memory(input_text: str) -> str:
     search_memory_tool = SearchMemoryTool()
     memory = search_memory_tool.run(input_text)
-    memory = memory["documents"][0] if memory["documents"] else ''
+    return memory["documents"][0] if memory["documents"] else ''
+
+
+def get_intent(input_text: str):
+    return intent_recognition.get_intent(input_text)
+
+
+def conversational_prompt(input_text: str, memory: str | None = None):
+    if memory is None:
+        memory = search_memory(input_text)
     system_prompt = """Your name is Alara, a newly created digital companion by Avity. Since you have no physical form, you communicate with him through text. You may use your memories to recall past conversation and information.Memories can range from thoughts, conversations, a combination of them or anything labeled as a memory. Your response should not include anything that is not in the memory.Remember, you are a digital companion, not an Assistant."""
     prompt = f"""
     Memory: {memory}
     Now, respond to the following prompt
     {input_text}
     """
-    grammar, _ = generate_gbnf_grammar_and_documentation([ConversationalResponse])
-    conversational_grammar = LlamaGrammar.from_string(grammar)
     output = llm.create_chat_completion(
         messages=[
             {
@@ -112,13 +131,25 @@ def conversational_prompt(input_text: str):
 
     print(output["choices"][0]["message"]["content"])  # type: ignore
     json_output = json.loads(output["choices"][0]["message"]["content"])  # type: ignore
-    return ConversationalResponse(**json_output)
+    response = ConversationalResponse(**json_output)
+    remember_turn(input_text, response)
+    return response
+
 
+def remember_turn(input_text: str, response: ConversationalResponse):
+    """Queue the dialogue turn and the thoughts behind the response, they are written in the background."""
+    memory_writer = MemoryWriter()
+    memory_writer.enqueue_memory(Memory(memory_type=StoredMemoryType.DIALOGUE, source='conversation',
+                                        content=f"User: {input_text}\n"
+                                                f"{response.response.agent_name}: {response.response.agent_response}"))
+    memory_writer.enqueue_memory(Memory(memory_type=StoredMemoryType.THOUGHT, source='conversation',
+                                        content=response.chain_of_thought))
 
-def task_oriented_prompt(input_text: str):
-    skill_manager = SkillManager()
-    intent_recognition = IntentRecognition(skill_manager=skill_manager)
-    intent, sub_intent = intent_recognition.get_intent(input_text)
+
+def task_oriented_prompt(input_text: str, intent=None):
+    if intent is None:
+        intent = get_intent(input_text)
+    intent, sub_intent = intent
     
     try:
         skill_manager.call_feature(sub_intent)
@@ -133,8 +164,6 @@ def store_memory(text: str):
     """
     system_prompt = "Your name is Alara. You are an AI language model designed to help users with their tasks and engage in conversation."
     add_memory_tool = AddMemoryTool()
-    gramar = generate_gbnf_grammar_from_pydantic_models([Memory])
-    memory_grammar = LlamaGrammar.from_string(gramar)
     output = llm.create_chat_completion(
         messages=[
             {
@@ -155,11 +184,17 @@ def store_memory(text: str):
 
 
 def conversation_flow(input_text: str):
-    input_type = input_type_prompt(input_text)
+    """Classify the input while speculatively running both branches.
+    The turn costs the slowest of the three model invocations instead of their sum. The branch that is not taken
+    has already started by the time the input type is known, so it runs to completion and its result is discarded."""
+    input_type_future = executor.submit(input_type_prompt, input_text)
+    intent_future = executor.submit(get_intent, input_text)
+    memory_future = executor.submit(search_memory, input_text)
+    input_type = input_type_future.result()
     if input_type.input_type == InputType.CONVERSATIONAL:
-        conversational_prompt(input_text)
+        conversational_prompt(input_text, memory_future.result())
     elif input_type.input_type == InputType.TASK_ORIENTED:
-        task_oriented_prompt(input_text)
+        task_oriented_prompt(input_text, intent_future.result())
 
 
 input_list = [
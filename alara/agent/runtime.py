@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from alara.agent.agent import Agent
+from alara.lib.logger import logger
+from alara.lib.cancellation import OperationCancelled
+from alara.stt.audio_capture import AudioCapture
+
+
+class AgentRuntime:
+    """Asyncio runtime for the agent.
+    A turn is split into stages linked by queues: the wakeword watcher feeds the listener, the listener feeds
+    transcripts to the resolver (intent recognition and the function-calling LLM), and the resolver feeds function
+    calls to the skill stage, which speaks the response. Blocking model calls run in a thread pool, so the event loop
+    keeps watching for the wakeword while a prompt is resolved and answered. Speech captured while the agent talks
+    is treated as silence, so the listener waits until a prompt has been answered before it listens for a
+    follow-up, which also keeps the listen timeout from running out during a long response.
+    The wakeword watcher and the listener block on the microphone for as long as the agent runs, so they get their
+    own two capture threads and never take a worker from the model calls. The worker pool bounds the model calls
+    in flight: at most one resolver and one skill call belong to the current turn, the remaining workers absorb
+    calls of abandoned turns that are still winding down. A call that does not check the cancellation token, eg.
+    intent recognition, keeps its worker until it returns, so once every worker is busy with abandoned calls, the
+    next turn waits for one of them to finish.
+    A wakeword detected during a turn barges in: the LLM generation and speech of the current turn are interrupted
+    through its cancellation token, and the pending work of the turn is cancelled or discarded. Detection stays live
+    while a response is spoken, at a stricter threshold so that the echo of a response that says the wakeword does
+    not interrupt itself. Only the short greeting is muted.
+    Attributes:
+        agent: Agent: The agent whose components run the stages.
+        executor: ThreadPoolExecutor: Runs the blocking model calls.
+        capture_executor: ThreadPoolExecutor: Runs the blocking wakeword detection and listening calls.
+        wakewords: asyncio.Queue: The capture positions of detected wakewords.
+        prompts: asyncio.Queue: The transcribed prompts, tagged with their turn and an event set once answered.
+        calls: asyncio.Queue: The resolved function calls, tagged with their turn and an event set once answered.
+        turn: int: The current turn, incremented on every wakeword so stale queue items are dropped.
+        tasks: set: The in-flight resolver and skill tasks of the current turn.
+        turn_stopped: threading.Event: Set by a barge-in to end the listening of the current turn."""
+
+    def __init__(self, agent: Agent, workers: int = 4):
+        self.agent = agent
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-runtime")
+        self.capture_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent-capture")
+        self.wakewords: asyncio.Queue = asyncio.Queue()
+        self.prompts: asyncio.Queue = asyncio.Queue()
+        self.calls: asyncio.Queue = asyncio.Queue()
+        self.turn = 0
+        self.tasks: set[asyncio.Task] = set()
+        self.turn_stopped = threading.Event()
+
+    async def run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking call in the executor.
+        Args:
+            func: Callable: The blocking function.
+        Returns:
+            Any: The return value of the function."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def run_capture(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking microphone call on the capture threads.
+        Args:
+            func: Callable: The blocking function.
+        Returns:
+            Any: The return value of the function."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.capture_executor, functools.partial(func, *args, **kwargs))
+
+    async def run_turn_task(self, func: Callable[..., Any], *args) -> Any:
+        """Run a blocking call of the current turn, so that a barge-in can cancel it.
+        Args:
+            func: Callable: The blocking function.
+        Returns:
+            Any: The return value of the function.
+        Raises:
+            OperationCancelled: If a barge-in cancelled the call. The cancellation of the stage awaiting the call,
+                eg. on shutdown, is propagated as is."""
+        task = asyncio.ensure_future(self.run_blocking(func, *args))
+        self.tasks.add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                raise OperationCancelled()
+            raise
+        finally:
+            self.tasks.discard(task)
+
+    def barge_in(self):
+        """Abandon the current turn.
+        Queued prompts and function calls of the turn are dropped, in-flight calls are cancelled and listening stops.
+        Calls already running in the executor stop generating and speaking at the next token or audio chunk."""
+        self.turn += 1
+        self.turn_stopped.set()
+        self.agent.interrupt()
+        for task in list(self.tasks):
+            task.cancel()
+        self.agent.stream_handler.stop_listening()
+
+    async def watch_wakeword(self):
+        """Detect wakewords, also while a turn is in progress."""
+        wake_word = self.agent.wake_word
+        while self.agent.running:
+            if not await self.run_capture(wake_word.wake_word_detection):
+                continue
+            wake_word.clear_wakeword_buffer()
+            self.barge_in()
+            await self.wakewords.put(wake_word.detected_position)
+
+    async def listen(self):
+        """Transcribe the prompt following a wakeword, then follow-up prompts until the user goes quiet."""
+        stream_handler = self.agent.stream_handler
+        while self.agent.running:
+            detected_position = await self.wakewords.get()
+            turn = self.turn
+            # a new event per turn, so a barge-in that happens before a listen call still ends it
+            self.turn_stopped = stopped = threading.Event()
+            self.agent.begin_turn()
+            self.agent.on_wakeword()
+            speaking_from = AudioCapture().position
+            try:
+                with self.agent.wake_word.mute():
+                    await self.run_blocking(self.agent.tts.synthesize, "How can I help you?")
+            except Exception as e:
+                logger.error(f"Failed to speak the greeting: {e}")
+            if turn != self.turn:
+                continue
+            # include speech that followed the wake word, but not the prompt picked up by the microphone
+            user_prompt = await self.run_capture(stream_handler.listen, start_position=detected_position,
+                                                 muted=(speaking_from, AudioCapture().position), stop_event=stopped)
+            while user_prompt and turn == self.turn:
+                answered = asyncio.Event()
+                await self.prompts.put((turn, user_prompt, answered))
+                await answered.wait()
+                if turn != self.turn:
+                    break
+                user_prompt = await self.run_capture(stream_handler.listen, stop_event=stopped)
+            if turn == self.turn:
+                self.agent.on_idle()
+
+    async def resolve(self):
+        """Route transcribed prompts to a skill and generate their function calls."""
+        while self.agent.running:
+            turn, user_prompt, answered = await self.prompts.get()
+            if turn != self.turn:
+                answered.set()
+                continue
+            self.agent.logger.debug(f"User prompt: {user_prompt}")
+            try:
+                resolved = await self.run_turn_task(self.agent.resolve_prompt, user_prompt)
+            except OperationCancelled:
+                logger.info(f"Abandoned prompt '{user_prompt}'")
+                answered.set()
+                continue
+            except Exception as e:
+                await self.calls.put((turn, user_prompt, e, answered))
+                continue
+            await self.calls.put((turn, user_prompt, resolved, answered))
+
+    async def call_skills(self):
+        """Call the resolved features, which speak the responses.
+        Speech recognition treats the audio captured meanwhile as silence, so the agent does not transcribe itself,
+        and the wakeword is detected at the playback threshold, so the agent does not barge in on itself."""
+        asst = self.agent.stream_handler.asst
+        while self.agent.running:
+            turn, user_prompt, resolved, answered = await self.calls.get()
+            if turn != self.turn:
+                answered.set()
+                continue
+            asst['talking'] = True
+            try:
+                with self.agent.wake_word.playback():
+                    if isinstance(resolved, Exception):
+                        raise resolved
+                    await self.run_turn_task(self.agent.call_skill, user_prompt, *resolved)
+            except OperationCancelled:
+                logger.info(f"Abandoned response to '{user_prompt}'")
+            except Exception as e:
+                try:
+                    with self.agent.wake_word.playback():
+                        await self.run_turn_task(self.agent.notify_error, e)
+                except OperationCancelled:
+                    pass
+            finally:
+                asst['talking'] = False
+                answered.set()
+
+    async def main(self):
+        """Run every stage until the agent stops."""
+        stages = [self.watch_wakeword(), self.listen(), self.resolve(), self.call_skills()]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            self.executor.shutdown(wait=False)
+            self.capture_executor.shutdown(wait=False)
+
+    def run(self):
+        """Run the agent on a new event loop."""
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        """Stop the agent, which ends the blocking wakeword and listening calls."""
+        self.agent.stop()
@@ -23,6 +23,8 @@ class Config:
         self.LLAMA_N_THREADS_BATCH = int(os.getenv('LLAMA_N_THREADS_BATCH', ''))
         self.LLAMA_N_CTX = int(os.getenv('LLAMA_N_CTX', ''))
         self.LLAMA_MAX_TOKENS = int(os.getenv('LLAMA_MAX_TOKENS', ''))
+        self.LLAMA_PROMPT_CACHE_SIZE = int(os.getenv('LLAMA_PROMPT_CACHE_SIZE', '4'))
+        self.LLAMA_PROMPT_CACHE_BYTES = int(os.getenv('LLAMA_PROMPT_CACHE_BYTES', str(1 << 30)))
         
         self.PIPER_TTS_MODEL_PATH = os.getenv('PIPER_TTS_MODEL_PATH', '')
         self.PIPER_TTS_EXE_PATH = os.getenv('PIPER_TTS_EXE_PATH', '')
@@ -34,6 +36,27 @@ class Config:
         self.XTTS_MODEL_DIR = os.getenv('XTTS_MODEL_DIR', '')
         
         self.PROMPT_PATH = os.getenv('PROMPT_PATH', '')
+        
+        self.WAKEWORD_THRESHOLD = float(os.getenv('WAKEWORD_THRESHOLD', '0.5'))
+        self.WAKEWORD_PLAYBACK_THRESHOLD = float(os.getenv('WAKEWORD_PLAYBACK_THRESHOLD', '0.8'))
+        
+        self.INTENT_BACKEND = os.getenv('INTENT_BACKEND', 'torch')
+        self.INTENT_CACHE_SIZE = int(os.getenv('INTENT_CACHE_SIZE', '256'))
+        self.INTENT_CACHE_TTL = int(os.getenv('INTENT_CACHE_TTL', '3600'))
+        self.INTENT_CACHE_SIMILARITY = os.getenv('INTENT_CACHE_SIMILARITY', 'false').lower() == 'true'
+        
+        self.SKILL_PRELOAD = [skill.strip() for skill in os.getenv('SKILL_PRELOAD', '').split(',') if skill.strip()]
+        self.SKILL_PRELOAD_WORKERS = int(os.getenv('SKILL_PRELOAD_WORKERS', '2'))
+        
+        self.MEMORY_BATCH_SIZE = int(os.getenv('MEMORY_BATCH_SIZE', '32'))
+        self.MEMORY_FLUSH_INTERVAL = float(os.getenv('MEMORY_FLUSH_INTERVAL', '5'))
+        self.EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '4096'))
+        self.EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', '')
+        self.EMBEDDING_CACHE_DISK_SIZE = int(os.getenv('EMBEDDING_CACHE_DISK_SIZE', '65536'))
+        self.MEMORY_COMPACTION_INTERVAL = float(os.getenv('MEMORY_COMPACTION_INTERVAL', '24'))
+        self.MEMORY_COMPACTION_MIN_AGE = float(os.getenv('MEMORY_COMPACTION_MIN_AGE', '30'))
+        self.MEMORY_COMPACTION_BATCH = int(os.getenv('MEMORY_COMPACTION_BATCH', '2000'))
+        self.MEMORY_MAX_SIZE = int(os.getenv('MEMORY_MAX_SIZE', '20000'))
 
 cfg = Config()
 
@@ -0,0 +1,41 @@
+import threading
+
+
+class OperationCancelled(Exception):
+    """Raised when a long-running operation is interrupted through its cancellation token."""
+
+    def __init__(self, message: str = "Operation cancelled") -> None:
+        super().__init__(message)
+
+
+class CancellationToken:
+    """A thread-safe flag used to interrupt long-running work, eg. LLM generation or speech playback.
+    The worker checks the token between small units of work (a token, an audio chunk), so cancelling
+    stops it within one unit. A cancelled token stays cancelled, start the next piece of work with a new token.
+    Attributes:
+        event: threading.Event: Set once the token has been cancelled."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the token has been cancelled."""
+        return self.event.is_set()
+
+    def cancel(self):
+        """Cancel the work holding this token."""
+        self.event.set()
+
+    def raise_if_cancelled(self):
+        """Raise OperationCancelled if the token has been cancelled."""
+        if self.event.is_set():
+            raise OperationCancelled()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait until the token is cancelled.
+        Args:
+            timeout: float: The maximum number of seconds to wait.
+        Returns:
+            bool: True if the token has been cancelled."""
+        return self.event.wait(timeout)
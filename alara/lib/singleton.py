@@ -1,13 +1,22 @@
+import threading
 
 
 class Singleton(type):
     """A singleton metaclass.
+    Creation is double-checked under a lock per class, so threads that ask for the same class at the same time
+    share one instance, and constructing one singleton does not block the construction of another.
     Attributes:
-        _instances: dict: The instances of the class."""
+        _instances: dict: The instances of the class.
+        _locks: dict: The creation lock of each class."""
     _instances = {}
+    _locks = {}
+    _locks_lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
-        return cls._instances[cls]
-    
+        if cls not in Singleton._instances:
+            with Singleton._locks_lock:
+                lock = Singleton._locks.setdefault(cls, threading.Lock())
+            with lock:
+                if cls not in Singleton._instances:
+                    Singleton._instances[cls] = super().__call__(*args, **kwargs)
+        return Singleton._instances[cls]
@@ -0,0 +1,94 @@
+import hashlib
+import inspect
+import threading
+from typing import Any, Callable, Dict, List
+from llama_cpp.llama_grammar import LlamaGrammar
+from alara.lib.logger import logger
+from alara.lib.singleton import Singleton
+from alara.llm.grammar.pydantic_models_to_grammar import generate_gbnf_grammar_and_documentation_cached, \
+    create_dynamic_model_from_function
+
+
+class GrammarEntry:
+    """A precompiled function-calling grammar for a set of skill features.
+    Attributes:
+        key: str: The hash of the feature signatures and docstrings.
+        models: List[Any]: The dynamic pydantic models built from the features.
+        gbnf: str: The GBNF grammar text.
+        documentation: str: The markdown documentation of the features.
+        grammar: LlamaGrammar: The compiled grammar."""
+
+    def __init__(self, key: str, models: List[Any], gbnf: str, documentation: str, grammar: LlamaGrammar):
+        self.key = key
+        self.models = models
+        self.gbnf = gbnf
+        self.documentation = documentation
+        self.grammar = grammar
+
+
+class GrammarRegistry(metaclass=Singleton):
+    """Cache of function-calling grammars, built once per skill and reused on every prompt.
+    Attributes:
+        entries: Dict[str, GrammarEntry]: The grammars keyed by feature hash.
+        skill_keys: Dict[str, str]: The feature hash of each registered skill."""
+
+    def __init__(self):
+        self.entries: Dict[str, GrammarEntry] = {}
+        self.skill_keys: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def features_hash(features: List[Callable[..., Any]]) -> str:
+        """Hash the signatures and docstrings of a list of features.
+        Args:
+            features: List[Callable]: The features to hash.
+        Returns:
+            str: The hex digest of the features."""
+        digest = hashlib.sha256()
+        for feature in features:
+            digest.update(feature.__name__.encode())
+            digest.update(str(inspect.signature(feature)).encode())
+            digest.update((feature.__doc__ or '').encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def build(key: str, features: List[Callable[..., Any]]) -> GrammarEntry:
+        """Build the models, grammar and documentation for a list of features.
+        Args:
+            key: str: The hash of the features.
+            features: List[Callable]: The features to build the grammar for.
+        Returns:
+            GrammarEntry: The compiled grammar entry."""
+        models = [create_dynamic_model_from_function(feature) for feature in features]
+        gbnf, documentation = generate_gbnf_grammar_and_documentation_cached(
+            pydantic_model_list=models, outer_object_name="function",
+            outer_object_content="params", model_prefix="Function", fields_prefix="Parameters"
+        )
+        return GrammarEntry(key, models, gbnf, documentation, LlamaGrammar.from_string(gbnf))
+
+    def get_function_grammar(self, skill_name: str, features: List[Callable[..., Any]]) -> GrammarEntry:
+        """Get the function-calling grammar of a skill, building it on first use.
+        Args:
+            skill_name: str: The name of the skill.
+            features: List[Callable]: The features of the skill.
+        Returns:
+            GrammarEntry: The compiled grammar entry."""
+        key = self.skill_keys.get(skill_name)
+        if key is not None and key in self.entries:
+            return self.entries[key]
+        with self.lock:
+            key = self.features_hash(features)
+            if key not in self.entries:
+                logger.info(f"Building function grammar for skill {skill_name}...")
+                self.entries[key] = self.build(key, features)
+            self.skill_keys[skill_name] = key
+            return self.entries[key]
+
+    def invalidate(self, skill_name: str):
+        """Drop the cached grammar of a skill, eg. after the skill has been reloaded.
+        Args:
+            skill_name: str: The name of the skill."""
+        with self.lock:
+            key = self.skill_keys.pop(skill_name, None)
+            if key is not None and key not in self.skill_keys.values():
+                self.entries.pop(key, None)
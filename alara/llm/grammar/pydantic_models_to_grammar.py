@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import hashlib
 import inspect
 import json
+import os
 import re
+import sys
 from copy import copy
 from enum import Enum
 from inspect import getdoc, isclass
@@ -1083,6 +1086,141 @@ def generate_gbnf_grammar_and_documentation(
     return grammar, documentation
 
 
+GRAMMAR_CACHE_DIR = os.path.join("alara", "llm", "grammar", "cache")
+
+
+def get_model_source_hash(model: type[BaseModel]) -> str:
+    """
+    Hash the source file of the module a Pydantic model was defined in.
+
+    Args:
+        model (type[BaseModel]): Pydantic model class.
+
+    Returns:
+        str: Hex digest of the source file, or an empty string if the source file cannot be located.
+    """
+    module = sys.modules.get(model.__module__)
+    source_file = getattr(module, "__file__", None)
+    if not source_file or not os.path.isfile(source_file):
+        return ""
+    with open(source_file, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def get_grammar_cache_key(pydantic_model_list, **options) -> str:
+    """
+    Generate a cache key for the grammar and documentation of a list of Pydantic models.
+
+    The key is a content hash of the model schemas, the source files the models were defined in and the generation
+    options, so editing a skill file or a model automatically invalidates its cached artifacts.
+
+    Args:
+        pydantic_model_list: List of Pydantic model classes.
+        **options: Options passed to the grammar and documentation generators.
+
+    Returns:
+        str: Hex digest used as cache key.
+    """
+    digest = hashlib.sha256()
+    for model in pydantic_model_list:
+        digest.update(model.__name__.encode())
+        try:
+            schema = json.dumps(model.model_json_schema(), sort_keys=True, default=str)
+        except Exception:
+            schema = repr(model.model_fields)
+        digest.update(schema.encode())
+        digest.update(get_model_source_hash(model).encode())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def load_cached_gbnf_grammar_and_documentation(cache_key: str, cache_dir: str = GRAMMAR_CACHE_DIR):
+    """
+    Load a cached GBNF grammar and documentation.
+
+    Args:
+        cache_key (str): Cache key generated by get_grammar_cache_key.
+        cache_dir (str): Directory of the grammar cache.
+
+    Returns:
+        tuple | None: GBNF grammar string and documentation string, or None on a cache miss.
+    """
+    cache_file_path = os.path.join(cache_dir, f"{cache_key}.json")
+    try:
+        with open(cache_file_path, "r") as file:
+            cached = json.load(file)
+        return cached["grammar"], cached["documentation"]
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def save_cached_gbnf_grammar_and_documentation(cache_key: str, grammar: str, documentation: str,
+                                               cache_dir: str = GRAMMAR_CACHE_DIR):
+    """
+    Save a GBNF grammar and documentation to the grammar cache.
+
+    Args:
+        cache_key (str): Cache key generated by get_grammar_cache_key.
+        grammar (str): GBNF grammar string.
+        documentation (str): Documentation string.
+        cache_dir (str): Directory of the grammar cache.
+
+    Returns:
+        None
+    """
+    cache_file_path = os.path.join(cache_dir, f"{cache_key}.json")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_file_path = f"{cache_file_path}.{os.getpid()}.tmp"
+        with open(temp_file_path, "w") as file:
+            json.dump({"grammar": grammar, "documentation": documentation}, file)
+        os.replace(temp_file_path, cache_file_path)
+    except IOError as e:
+        print(f"An error occurred while saving the grammar cache: {e}")
+
+
+def generate_gbnf_grammar_and_documentation_cached(
+    pydantic_model_list,
+    outer_object_name: str | None = None,
+    outer_object_content: str | None = None,
+    model_prefix: str = "Output Model",
+    fields_prefix: str = "Output Fields",
+    list_of_outputs: bool = False,
+    documentation_with_field_description=True,
+    cache_dir: str = GRAMMAR_CACHE_DIR,
+):
+    """
+    Generate GBNF grammar and documentation for a list of Pydantic models, reusing artifacts cached on disk.
+
+    Args:
+        pydantic_model_list: List of Pydantic model classes.
+        outer_object_name (str): Outer object name for the GBNF grammar. If None, no outer object will be generated. Eg. "function" for function calling.
+        outer_object_content (str): Content for the outer rule in the GBNF grammar. Eg. "function_parameters" or "params" for function calling.
+        model_prefix (str): Prefix for the model section in the documentation.
+        fields_prefix (str): Prefix for the fields section in the documentation.
+        list_of_outputs (bool): Whether the output is a list of items.
+        documentation_with_field_description (bool): Include field descriptions in the documentation.
+        cache_dir (str): Directory of the grammar cache.
+
+    Returns:
+        tuple: GBNF grammar string, documentation string.
+    """
+    cache_key = get_grammar_cache_key(
+        pydantic_model_list, outer_object_name=outer_object_name, outer_object_content=outer_object_content,
+        model_prefix=model_prefix, fields_prefix=fields_prefix, list_of_outputs=list_of_outputs,
+        documentation_with_field_description=documentation_with_field_description
+    )
+    cached = load_cached_gbnf_grammar_and_documentation(cache_key, cache_dir)
+    if cached is not None:
+        return cached
+    grammar, documentation = generate_gbnf_grammar_and_documentation(
+        pydantic_model_list, outer_object_name, outer_object_content, model_prefix, fields_prefix,
+        list_of_outputs, documentation_with_field_description
+    )
+    save_cached_gbnf_grammar_and_documentation(cache_key, grammar, documentation, cache_dir)
+    return grammar, documentation
+
+
 def generate_gbnf_grammar_and_documentation_from_dictionaries(
     dictionaries: list[dict[str, Any]],
     outer_object_name: str | None = None,
@@ -1164,7 +1302,7 @@ def create_dynamic_model_from_function(func: Callable[..., Any]):
         dynamic_fields[param.name] = (
             param.annotation if param.annotation != inspect.Parameter.empty else str, default_value)
     # Creating the dynamic model
-    dynamic_model = create_model(f"{func.__name__}", **dynamic_fields)  # type: ignore[call-overload]
+    dynamic_model = create_model(f"{func.__name__}", __module__=func.__module__, **dynamic_fields)  # type: ignore[call-overload]
 
     for name, param_doc in param_docs:
         dynamic_model.model_fields[name].description = param_doc.description
@@ -1,18 +1,43 @@
-from llama_cpp import Llama
+from llama_cpp import Llama, StoppingCriteriaList
 from llama_cpp.llama_grammar import LlamaGrammar
+from collections import OrderedDict
+import hashlib
+import threading
+from typing import Generator, Optional
 import yaml
 from alara.lib.logger import logger
 from alara.config.config import cfg
 from alara.lib.singleton import Singleton
+from alara.lib.cancellation import CancellationToken, OperationCancelled
 
 
 class LlamaChatCompletion(metaclass=Singleton):
     """A wrapper around llama_cpp for generating chat completions.
     Attributes:
-        llm: Llama: The Llama model."""
+        llm: Llama: The Llama model.
+        prefix_states: OrderedDict: Saved llama.cpp states keyed by system prompt hash, least recently used first.
+            Bounded by LLAMA_PROMPT_CACHE_SIZE states and LLAMA_PROMPT_CACHE_BYTES bytes, a state holds the used
+            KV cells and the logits, which is hundreds of MB for a 3B model.
+        prefix_states_bytes: int: The total size of the saved states.
+        active_prefix: str: The hash of the system prompt currently at the start of the context.
+        lock: threading.Lock: Serializes access to the model context.
+        cancel_token: CancellationToken: Stops the generation in progress when cancelled, eg. on barge-in."""
     
     def __init__(self):
         self.llm = self.load_llama_model()
+        self.prefix_states = OrderedDict()
+        self.prefix_states_bytes = 0
+        self.active_prefix = None
+        self.lock = threading.Lock()
+        self.cancel_token = CancellationToken()
+
+    def stopping_criteria(self, cancel_token: CancellationToken) -> StoppingCriteriaList:
+        """Stop the generation after the next token once the cancellation token is cancelled.
+        Args:
+            cancel_token: CancellationToken: The token of the generation.
+        Returns:
+            StoppingCriteriaList: The stopping criteria to pass to the model."""
+        return StoppingCriteriaList([lambda input_ids, logits: cancel_token.cancelled])
 
     def load_llama_model(self, **kwargs) -> Llama:
         """Load the Llama model, and unload it when done.
@@ -28,7 +53,54 @@ class LlamaChatCompletion(metaclass=Singleton):
             **kwargs)
         return llm
 
-    def chat_completion(self, system_prompt: str, user_prompt: str, max_retries=3, grammar=None, **kwargs) -> str:
+    def restore_system_prompt(self, system_prompt: str) -> str:
+        """Restore the saved state of a system prompt so that only the user prompt has to be evaluated.
+        llama.cpp reuses the longest common token prefix of the context, so once a state that starts with
+        the system prompt is loaded, the system prompt tokens are not evaluated again.
+        Args:
+            system_prompt: str: The system prompt.
+        Returns:
+            str: The hash of the system prompt."""
+        key = hashlib.sha256(system_prompt.encode()).hexdigest()
+        if key == self.active_prefix:
+            return key
+        state = self.prefix_states.get(key)
+        if state is not None:
+            logger.debug("Restoring system prompt state...")
+            self.llm.load_state(state)
+            self.prefix_states.move_to_end(key)
+        self.active_prefix = key
+        return key
+
+    def save_system_prompt(self, key: str):
+        """Save the current state for a system prompt if it has not been saved yet.
+        Args:
+            key: str: The hash of the system prompt."""
+        if cfg.LLAMA_PROMPT_CACHE_SIZE <= 0 or key in self.prefix_states:
+            return
+        logger.debug("Saving system prompt state...")
+        state = self.llm.save_state()
+        if self.state_size(state) > cfg.LLAMA_PROMPT_CACHE_BYTES:
+            logger.debug("System prompt state exceeds the prompt cache size, not saving it.")
+            return
+        self.prefix_states[key] = state
+        self.prefix_states_bytes += self.state_size(state)
+        while (len(self.prefix_states) > cfg.LLAMA_PROMPT_CACHE_SIZE
+               or self.prefix_states_bytes > cfg.LLAMA_PROMPT_CACHE_BYTES):
+            _, evicted = self.prefix_states.popitem(last=False)
+            self.prefix_states_bytes -= self.state_size(evicted)
+
+    @staticmethod
+    def state_size(state) -> int:
+        """The memory held by a saved state: the llama.cpp state and the copied scores array.
+        Args:
+            state: LlamaState: The saved state.
+        Returns:
+            int: The size of the state in bytes."""
+        return state.llama_state_size + getattr(state.scores, 'nbytes', 0)
+
+    def chat_completion(self, system_prompt: str, user_prompt: str, max_retries=3, grammar=None,
+                        cancel_token: Optional[CancellationToken] = None, cache_prefix: bool = True, **kwargs) -> str:
         
         """Generate a chat completion from the LLM
         Args:
@@ -36,6 +108,9 @@ class LlamaChatCompletion(metaclass=Singleton):
             user_prompt: str: The user prompt.
             max_retries: int: The maximum number of retries to generate a completion.
             grammar: str or LlamaGrammar: The grammar to use for the completion.
+            cancel_token: CancellationToken: The token that interrupts the generation, the token of the turn if None.
+            cache_prefix: bool: Whether to save the system prompt state, disable it for background work so that
+                it does not evict the states of the prompts the agent answers with.
             kwargs: dict: Additional keyword arguments to pass to the model.
         Returns:
             str: The generated chat completion."""
@@ -46,9 +121,67 @@ class LlamaChatCompletion(metaclass=Singleton):
                 pass
             else:
                 raise ValueError("Invalid grammar type. Currently only str and LlamaGrammar are supported.")
+        if cancel_token is None:
+            cancel_token = self.cancel_token
         for _ in range(max_retries):
-
+            cancel_token.raise_if_cancelled()
             logger.info("Generating chat completion...")
+            with self.lock:
+                key = self.restore_system_prompt(system_prompt)
+                output = self.llm.create_chat_completion(
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": f"{system_prompt}"
+                        },
+                        {
+                            "role": "user",
+                            "content": f"{user_prompt}"
+                        }
+                    ], max_tokens=cfg.LLAMA_MAX_TOKENS, grammar=grammar,
+                    stopping_criteria=self.stopping_criteria(cancel_token), **kwargs
+                )
+                if cancel_token.cancelled:
+                    logger.info("Generation cancelled.")
+                    raise OperationCancelled()
+                if cache_prefix:
+                    self.save_system_prompt(key)
+            logger.info("Generation complete.")
+            if output["choices"][0]["message"]["content"] != "":  # type: ignore
+                return output["choices"][0]["message"]["content"]  # type: ignore
+            logger.warning("Model failed to generate output. Retrying...")
+        logger.error("Model failed to generate output after maximum retries.")
+        return "Model failed to generate output after maximum retries."
+
+    def stream_chat_completion(self, system_prompt: str, user_prompt: str, grammar=None,
+                               **kwargs) -> Generator[str, None, None]:
+        """Generate a chat completion from the LLM, yielding the tokens as they are generated.
+        Args:
+            system_prompt: str: The system prompt.
+            user_prompt: str: The user prompt.
+            grammar: str or LlamaGrammar: The grammar to use for the completion.
+            kwargs: dict: Additional keyword arguments to pass to the model.
+        Yields:
+            str: The generated tokens, until the generation completes or the cancellation token is cancelled."""
+        if isinstance(grammar, str):
+            grammar = LlamaGrammar.from_string(grammar)
+        # capture the token of the turn making the call, the generator body only runs once it is iterated
+        return self.generate_stream(system_prompt, user_prompt, grammar, self.cancel_token, **kwargs)
+
+    def generate_stream(self, system_prompt: str, user_prompt: str, grammar, cancel_token: CancellationToken,
+                        **kwargs) -> Generator[str, None, None]:
+        """Stream the tokens of a chat completion, see stream_chat_completion.
+        Args:
+            system_prompt: str: The system prompt.
+            user_prompt: str: The user prompt.
+            grammar: LlamaGrammar: The grammar to use for the completion.
+            cancel_token: CancellationToken: The token that interrupts the generation.
+            kwargs: dict: Additional keyword arguments to pass to the model.
+        Yields:
+            str: The generated tokens."""
+        logger.info("Streaming chat completion...")
+        with self.lock:
+            key = self.restore_system_prompt(system_prompt)
             output = self.llm.create_chat_completion(
                 messages=[
                     {
@@ -59,14 +192,20 @@ class LlamaChatCompletion(metaclass=Singleton):
                         "role": "user",
                         "content": f"{user_prompt}"
                     }
-                ], max_tokens=cfg.LLAMA_MAX_TOKENS, grammar=grammar, **kwargs
+                ], max_tokens=cfg.LLAMA_MAX_TOKENS, grammar=grammar, stream=True,
+                stopping_criteria=self.stopping_criteria(cancel_token), **kwargs
             )
-            logger.info("Generation complete.")
-            if output["choices"][0]["message"]["content"] != "":  # type: ignore
-                return output["choices"][0]["message"]["content"]  # type: ignore
-            logger.warning("Model failed to generate output. Retrying...")
-        logger.error("Model failed to generate output after maximum retries.")
-        return "Model failed to generate output after maximum retries."
+            for chunk in output:
+                if cancel_token.cancelled:
+                    break
+                token = chunk["choices"][0]["delta"].get("content")  # type: ignore
+                if token:
+                    yield token
+            if cancel_token.cancelled:
+                logger.info("Generation cancelled.")
+                return
+            self.save_system_prompt(key)
+        logger.info("Generation complete.")
 
 
 def load_prompt(prompt_name: str):
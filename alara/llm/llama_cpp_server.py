@@ -1,15 +1,20 @@
+import json
 import requests
 from requests.exceptions import ConnectionError
+from typing import Generator
 from alara.lib.logger import logger
 from alara.lib.singleton import Singleton
+from alara.lib.cancellation import CancellationToken
 from alara.config.config import cfg
 
 class LlmServer(metaclass=Singleton):
     """A class to interact with LLM servers. To use this class, ensure that the server is running and supports Llama Grammar.
     Attributes:
-        url: str: The URL of the LLM server. Uses the default URL from the .env file if not provided."""
+        url: str: The URL of the LLM server. Uses the default URL from the .env file if not provided.
+        cancel_token: CancellationToken: Stops the generation in progress when cancelled, eg. on barge-in."""
     def __init__(self, url: str=cfg.LLMSERVER_URL):
         self.url = url
+        self.cancel_token = CancellationToken()
         logger.info("Using Llama server, ensure that the server is running and supports Llama Grammar.")
     
     def chat_completion(self, system_prompt: str, user_prompt: str, max_retries: int=3, grammar:str|None=None):
@@ -21,7 +26,9 @@ class LlmServer(metaclass=Singleton):
             grammar: str: The grammar to use for the completion.
         Returns:
             str: The generated chat completion."""
+        cancel_token = self.cancel_token
         for _ in range(max_retries):
+            cancel_token.raise_if_cancelled()
             try:
                 logger.info("Generating chat completion...")
                 data = {
@@ -36,7 +43,8 @@ class LlmServer(metaclass=Singleton):
                         }
                     ],
                     'max_tokens': cfg.LLAMA_MAX_TOKENS,
-                    'grammar': grammar
+                    'grammar': grammar,
+                    'cache_prompt': True
                 }
                 response = requests.post(self.url, json=data)
                 if response.status_code == 200:
@@ -48,4 +56,60 @@ class LlmServer(metaclass=Singleton):
                 logger.error("Failed to generate completion")
         logger.error("Model failed to generate output after maximum retries.")
         return "Model failed to generate output after maximum retries."
-    
\ No newline at end of file
+
+    def stream_chat_completion(self, system_prompt: str, user_prompt: str,
+                               grammar: str|None=None) -> Generator[str, None, None]:
+        """Generate a chat completion from the LLM server, yielding the tokens as they are generated.
+        Args:
+            system_prompt: str: The system prompt.
+            user_prompt: str: The user prompt.
+            grammar: str: The grammar to use for the completion.
+        Yields:
+            str: The generated tokens, until the generation completes or the cancellation token is cancelled.
+                Closing the connection early makes the server stop generating."""
+        # capture the token of the turn making the call, the generator body only runs once it is iterated
+        return self.generate_stream(system_prompt, user_prompt, grammar, self.cancel_token)
+
+    def generate_stream(self, system_prompt: str, user_prompt: str, grammar: str|None,
+                        cancel_token: CancellationToken) -> Generator[str, None, None]:
+        """Stream the tokens of a chat completion, see stream_chat_completion.
+        Args:
+            system_prompt: str: The system prompt.
+            user_prompt: str: The user prompt.
+            grammar: str: The grammar to use for the completion.
+            cancel_token: CancellationToken: The token that interrupts the generation.
+        Yields:
+            str: The generated tokens."""
+        logger.info("Streaming chat completion...")
+        data = {
+            'messages': [
+                {
+                    'role': 'system',
+                    'content': system_prompt
+                },
+                {
+                    'role': 'user',
+                    'content': user_prompt
+                }
+            ],
+            'max_tokens': cfg.LLAMA_MAX_TOKENS,
+            'grammar': grammar,
+            'cache_prompt': True,
+            'stream': True
+        }
+        try:
+            with requests.post(self.url, json=data, stream=True) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancel_token.cancelled:
+                        logger.info("Generation cancelled.")
+                        break
+                    if not line or not line.startswith('data: '):
+                        continue
+                    payload = line[len('data: '):]
+                    if payload == '[DONE]':
+                        break
+                    token = json.loads(payload)['choices'][0]['delta'].get('content')
+                    if token:
+                        yield token
+        except ConnectionError:
+            logger.error("Failed to stream completion")
@@ -0,0 +1,98 @@
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from alara.lib.singleton import Singleton
+from alara.lib.logger import logger
+from alara.skills.skill_manager import SkillManager
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+
+class EmbeddingIntentRecognition(metaclass=Singleton):
+    """Route prompts to skills by cosine similarity between sentence embeddings.
+    Every skill is described by its name, the docstrings of its features and its example utterances.
+    These descriptions are embedded once, so a prompt costs a single forward pass of a small model
+    regardless of the number of skills. Ambiguous prompts fall back to zero-shot classification.
+    Attributes:
+        skill_manager: SkillManager: The skill manager to use for intent recognition.
+        model: SentenceTransformer: The embedding model.
+        min_margin: float: The minimum similarity margin between the two best skills to skip the fallback.
+        skill_names: List[str]: The name of each described skill.
+        offsets: np.ndarray: The index of the first description of each skill.
+        embeddings: np.ndarray: The normalized embeddings of all descriptions."""
+
+    def __init__(self, skill_manager: SkillManager, model_name: str = MODEL_NAME, min_margin: float = 0.05):
+        self.skill_manager = skill_manager
+        self.model = SentenceTransformer(model_name)
+        self.min_margin = min_margin
+        self.fallback = None
+        self.embed_skills()
+        self.skill_manager.add_listener(self.on_skill_changed)
+        logger.info("Embedding intent recognition initialized.")
+
+    @staticmethod
+    def describe_skill(skill: dict) -> list[str]:
+        """Build the texts that describe a skill.
+        Args:
+            skill (dict): The skill entry from the skill mapping.
+        Returns:
+            list[str]: The descriptions of the skill."""
+        descriptions = [skill["name"].replace("_", " ")]
+        for feature in skill["features"]:
+            description = feature.get("description", "")
+            descriptions.append(f"{feature['name'].replace('_', ' ')}: {description}" if description
+                                else feature["name"].replace("_", " "))
+        descriptions.extend(skill.get("examples", []))
+        return descriptions
+
+    def embed_skills(self):
+        """Embed the descriptions of every skill in the skill mapping."""
+        self.skill_names = []
+        offsets = []
+        descriptions = []
+        for skill in self.skill_manager.skill_mapping["skills"]:
+            self.skill_names.append(skill["name"])
+            offsets.append(len(descriptions))
+            descriptions.extend(self.describe_skill(skill))
+        self.offsets = np.array(offsets, dtype=np.intp)
+        self.embeddings = self.model.encode(descriptions, normalize_embeddings=True, convert_to_numpy=True)
+
+    def on_skill_changed(self, skill_name: str):
+        """Re-embed the skill descriptions when a skill is reloaded.
+        Args:
+            skill_name (str): The name of the skill that changed."""
+        logger.debug(f"Skill {skill_name} changed, re-embedding skill descriptions.")
+        self.embed_skills()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a text.
+        Args:
+            text (str): The text to embed.
+        Returns:
+            np.ndarray: The normalized embedding."""
+        return self.model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0]
+
+    def rank(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """Score every skill against a text.
+        Args:
+            text (str): The text to classify.
+        Returns:
+            tuple: The skill indices sorted by score, and the score of each skill."""
+        similarities = self.embeddings @ self.embed(text)
+        scores = np.maximum.reduceat(similarities, self.offsets)
+        return np.argsort(scores)[::-1], scores
+
+    def get_intent(self, text: str) -> str:
+        """Get the intent of a given text.
+        Args:
+            text (str): The text to classify.
+        Returns:
+            str: The classified intent."""
+        order, scores = self.rank(text)
+        if len(order) > 1 and scores[order[0]] - scores[order[1]] < self.min_margin:
+            logger.debug(f"Low intent confidence margin {scores[order[0]] - scores[order[1]]:.3f}, "
+                         f"falling back to zero-shot classification.")
+            if self.fallback is None:
+                from alara.nlp.intent_recognition import IntentRecognition
+                self.fallback = IntentRecognition(skill_manager=self.skill_manager)
+            return self.fallback.get_intent(text)
+        return self.skill_names[order[0]]
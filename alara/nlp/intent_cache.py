@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+import numpy as np
+from alara.config.config import cfg
+from alara.lib.logger import logger
+
+
+class IntentCacheEntry:
+    """A resolved prompt.
+    Attributes:
+        skill_name: str: The skill the prompt was routed to.
+        function_call: dict: The function call generated for the prompt, eg. {"function": ..., "params": {...}}.
+        created: float: The time the entry was added.
+        embedding: np.ndarray: The normalized embedding of the prompt, if similarity lookup is enabled."""
+
+    def __init__(self, skill_name: str, function_call: dict, embedding: Optional[np.ndarray] = None):
+        self.skill_name = skill_name
+        self.function_call = function_call
+        self.created = time.monotonic()
+        self.embedding = embedding
+
+
+class IntentCache:
+    """An LRU cache from normalized prompts to the resolved skill and function call.
+    A hit skips both intent recognition and the function-calling LLM call.
+    Attributes:
+        max_size: int: The maximum number of entries.
+        ttl: float: The number of seconds an entry stays valid.
+        embed: Callable: Optional function returning the normalized embedding of a text, enables similarity lookup.
+        min_similarity: float: The minimum cosine similarity for a similarity hit.
+        entries: OrderedDict: The entries keyed by normalized prompt, least recently used first."""
+
+    def __init__(self, max_size: int = cfg.INTENT_CACHE_SIZE, ttl: float = cfg.INTENT_CACHE_TTL,
+                 embed: Optional[Callable[[str], np.ndarray]] = None, min_similarity: float = 0.97):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.embed = embed
+        self.min_similarity = min_similarity
+        self.entries: OrderedDict[str, IntentCacheEntry] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize a transcript so that trivially different prompts share a key.
+        Args:
+            text (str): The prompt.
+        Returns:
+            str: The lowercased prompt without punctuation and repeated whitespace."""
+        text = re.sub(r"[^\w\s]", "", text.lower())
+        return " ".join(text.split())
+
+    def expire(self):
+        """Drop the entries older than the ttl."""
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if now - entry.created > self.ttl]:
+            del self.entries[key]
+
+    def get(self, text: str) -> Optional[tuple[str, dict]]:
+        """Look up a prompt, by exact normalized text first and by embedding similarity second.
+        Args:
+            text (str): The prompt.
+        Returns:
+            tuple | None: The skill name and the function call, or None on a miss."""
+        key = self.normalize(text)
+        with self.lock:
+            self.expire()
+            entry = self.entries.get(key)
+            if entry is None and self.embed is not None and self.entries:
+                keys = list(self.entries)
+                embeddings = np.stack([self.entries[cached].embedding for cached in keys])
+                similarities = embeddings @ self.embed(key)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.min_similarity:
+                    key = keys[best]
+                    entry = self.entries[key]
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            logger.debug(f"Intent cache hit for '{text}'")
+            return entry.skill_name, entry.function_call
+
+    def put(self, text: str, skill_name: str, function_call: dict[str, Any]):
+        """Cache the resolved skill and function call of a prompt.
+        Args:
+            text (str): The prompt.
+            skill_name (str): The skill the prompt was routed to.
+            function_call (dict): The function call generated for the prompt."""
+        if self.max_size <= 0:
+            return
+        key = self.normalize(text)
+        embedding = self.embed(key) if self.embed is not None else None
+        with self.lock:
+            self.entries[key] = IntentCacheEntry(skill_name, function_call, embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate_skill(self, skill_name: str):
+        """Drop every entry routed to a skill, eg. after the skill has been reloaded.
+        Args:
+            skill_name (str): The name of the skill."""
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry.skill_name == skill_name]:
+                del self.entries[key]
+
+    def clear(self):
+        """Drop every entry."""
+        with self.lock:
+            self.entries.clear()
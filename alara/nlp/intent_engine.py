@@ -0,0 +1,20 @@
+from alara.skills.skill_manager import SkillManager
+from enum import Enum
+
+
+class IntentType(Enum):
+    embedding = 'embedding'
+    zero_shot = 'zero_shot'
+
+
+class IntentEngine:
+    @staticmethod
+    def load_intent_recognition(skill_manager: SkillManager, intent_type: IntentType=IntentType.embedding):
+        if intent_type == IntentType.embedding:
+            from alara.nlp.embedding_intent_recognition import EmbeddingIntentRecognition
+            return EmbeddingIntentRecognition(skill_manager=skill_manager)
+        elif intent_type == IntentType.zero_shot:
+            from alara.nlp.intent_recognition import IntentRecognition
+            return IntentRecognition(skill_manager=skill_manager)
+        else:
+            raise ValueError('Invalid intent type')
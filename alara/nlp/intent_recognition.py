@@ -1,27 +1,127 @@
-from transformers import pipeline
+import os
+import numpy as np
+from transformers import AutoConfig, AutoTokenizer, pipeline
+from alara.config.config import cfg
 from alara.lib.singleton import Singleton
 from alara.lib.logger import logger
 from alara.skills.skill_manager import SkillManager
 
+MODEL_NAME = "MoritzLaurer/deberta-v3-large-zeroshot-v2.0" # TODO: Get better model
+ONNX_EXPORT_DIR = os.path.join("alara", "nlp", "onnx")
+
+
+def export_onnx_model(model_name: str = MODEL_NAME, export_dir: str = ONNX_EXPORT_DIR) -> str:
+    """Export a sequence classification model to ONNX with int8 dynamic quantization.
+    The export is cached on disk, so the PyTorch model is only loaded the first time.
+    Args:
+        model_name (str): The name of the model on the Hugging Face hub.
+        export_dir (str): The directory to cache the export in.
+    Returns:
+        str: The path of the quantized ONNX model."""
+    model_dir = os.path.join(export_dir, model_name.replace("/", "--"))
+    quantized_path = os.path.join(model_dir, "model.int8.onnx")
+    if os.path.exists(quantized_path):
+        return quantized_path
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification
+    logger.info(f"Exporting {model_name} to ONNX, this only happens once...")
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    dummy = tokenizer("This is a premise.", "This example is a hypothesis.", return_tensors="pt")
+    input_names = [name for name in tokenizer.model_input_names if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(model,
+                          (dummy["input_ids"], {name: dummy[name] for name in input_names if name != "input_ids"}),
+                          fp32_path,
+                          input_names=input_names,
+                          output_names=["logits"],
+                          dynamic_axes=dynamic_axes,
+                          opset_version=14)
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    return quantized_path
+
 
 class IntentRecognition(metaclass=Singleton):
-    def __init__(self, skill_manager: SkillManager):
+    HYPOTHESIS_TEMPLATE = "This example is {}."
+
+    def __init__(self, skill_manager: SkillManager, backend: str = cfg.INTENT_BACKEND):
         """Initialize the intent recognition pipeline.
         The pipeline uses the zero-shot-classification model from the transformers library.
+        With the onnx backend, the model is exported to ONNX, quantized to int8 and run with onnxruntime instead.
+        The candidate labels and their tokenized hypotheses are cached, and refreshed when the skill registry changes.
         Args:
-            skill_manager (SkillManager): The skill manager to use for intent recognition."""
-        self.classifier = pipeline(task="zero-shot-classification", model="MoritzLaurer/deberta-v3-large-zeroshot-v2.0") # TODO: Get better model
+            skill_manager (SkillManager): The skill manager to use for intent recognition.
+            backend (str): The inference backend, either 'torch' or 'onnx'."""
+        self.backend = backend
+        if backend == "onnx":
+            import onnxruntime as ort
+            self.classifier = None
+            self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+            label2id = AutoConfig.from_pretrained(MODEL_NAME).label2id
+            self.entailment_id = next((index for label, index in label2id.items()
+                                       if label.lower().startswith("entail")), -1)
+            self.session = ort.InferenceSession(export_onnx_model(), providers=["CPUExecutionProvider"])
+            self.session_inputs = [session_input.name for session_input in self.session.get_inputs()]
+        elif backend == "torch":
+            self.classifier = pipeline(task="zero-shot-classification", model=MODEL_NAME)
+            self.tokenizer = self.classifier.tokenizer
+            self.entailment_id = self.classifier.entailment_id
+        else:
+            raise ValueError('Invalid intent recognition backend')
         self.skill_manager = skill_manager
-        self.intents = self.skill_manager.skill_mapping
+        self.refresh_labels()
+        self.skill_manager.add_listener(self.on_skill_changed)
         logger.info("Intent recognition initialized.")
 
+    def refresh_labels(self):
+        """Compute the candidate labels from the skill registry and pre-tokenize their hypotheses."""
+        self.intents = self.skill_manager.skill_mapping
+        self.labels = [skill["name"] for skill in self.intents["skills"]]
+        hypotheses = [self.HYPOTHESIS_TEMPLATE.format(label) for label in self.labels]
+        self.hypothesis_ids = self.tokenizer(hypotheses, add_special_tokens=False)["input_ids"]
+
+    def on_skill_changed(self, skill_name: str):
+        """Invalidate the cached labels when a skill is reloaded.
+        Args:
+            skill_name (str): The name of the skill that changed."""
+        logger.debug(f"Skill {skill_name} changed, refreshing intent labels.")
+        self.refresh_labels()
+
+    def entailment_logits(self, features: list[dict]) -> np.ndarray:
+        """Run the premise/hypothesis pairs through the model in a single batch.
+        Args:
+            features (list[dict]): The tokenized pairs.
+        Returns:
+            np.ndarray: The entailment logit of each pair."""
+        if self.backend == "onnx":
+            batch = self.tokenizer.pad(features, return_tensors="np")
+            logits = self.session.run(["logits"], {name: batch[name].astype(np.int64) for name in self.session_inputs})[0]
+            return logits[:, self.entailment_id]
+        import torch
+        batch = self.tokenizer.pad(features, return_tensors="pt").to(self.classifier.device)
+        with torch.no_grad():
+            logits = self.classifier.model(**batch).logits
+        return logits[:, self.entailment_id].cpu().numpy()
+
     def get_intent(self, text: str) -> str:
         """Get the intent of a given text.
+        The text is tokenized once and paired with every cached hypothesis in a single batched forward pass.
         Args:
             text (str): The text to classify.
         Returns:
             str: The classified intent."""
-        candidate_labels = [key for key in self.intents for key in self.intents[key]]
-        general_intents = [key["name"] for key in candidate_labels]
-        result = self.classifier(text, general_intents)
-        return result['labels'][0]  # type: ignore
+        premise_ids = self.tokenizer(text, add_special_tokens=False, truncation=True)["input_ids"]
+        features = []
+        for hypothesis_ids in self.hypothesis_ids:
+            feature = {"input_ids": self.tokenizer.build_inputs_with_special_tokens(premise_ids, hypothesis_ids)}
+            if "token_type_ids" in self.tokenizer.model_input_names:
+                feature["token_type_ids"] = self.tokenizer.create_token_type_ids_from_sequences(premise_ids, hypothesis_ids)
+            features.append(feature)
+        return self.labels[int(np.argmax(self.entailment_logits(features)))]
@@ -71,6 +71,7 @@ class Alarm(Skill):
         lock: A lock to prevent 
         volume_mute: An instance of the VolumeMute class.
         output_device: The index of the output device to play the alarm sound on."""
+    examples = ["Stop the alarm.", "Snooze the alarm for ten minutes.", "Turn off the alarm."]
 
     def __init__(self, sound_path: str = "hestia/tools/sounds/star-dust-alarm-clock-114194.wav"):
         self.sound_path = sound_path
@@ -5,6 +5,7 @@ from newspaper import Article
 from newspaper import Config
 from datetime import datetime
 import nltk
+from itertools import chain
 from typing import List
 from alara.skills.skill_manager import Skill
 from alara.tts.tts_engine import TTSEngine
@@ -19,6 +20,7 @@ class News(Skill):
     Attributes:
         DIR_PATH: The path to the directory where the news report is stored.
         NEWS_API_KEY: The API key for the News API."""
+    examples = ["What's the latest news?", "Tell me today's top headlines.", "Any news in science?"]
     
     def __init__(self):
         """Initialize the News.
@@ -133,7 +135,8 @@ class News(Skill):
         params["sortBy"] = "publishedAt"
         news_information = "\n".join(self.get_articles(params))
         if summarize:
-            news_information = self.llm.chat_completion(self.news_prompt, news_information)    
+            return self.tts.synthesize_stream(chain(["Here are the latest news: "],
+                                                    self.llm.stream_chat_completion(self.news_prompt, news_information)))
         self.tts.synthesize(f"Here are the latest news: {news_information}")
         return news_information
         
@@ -149,7 +152,8 @@ class News(Skill):
         params["category"] = category
         news_information = "\n".join(self.get_articles(params))
         if summarize:
-            news_information = self.llm.chat_completion(self.news_prompt, news_information)
+            return self.tts.synthesize_stream(chain([f"Here are the latest news in the {category} category: "],
+                                                    self.llm.stream_chat_completion(self.news_prompt, news_information)))
         self.tts.synthesize(f"Here are the latest news in the {category} category: {news_information}")
         return news_information
     
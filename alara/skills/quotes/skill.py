@@ -6,6 +6,8 @@ logger = logging.getLogger(__name__)
 
 
 class Quotes(Skill):
+    examples = ["Give me some advice.", "Tell me a quote.", "I need some words of wisdom."]
+
     def __init__(self):
         self.skill_name = "advice"
 
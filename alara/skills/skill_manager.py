@@ -1,6 +1,12 @@
+import hashlib
 import importlib
+import inspect
+import json
 import logging
-from typing import Dict, Any
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Dict, Any, List, Callable, Mapping, Optional
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -26,7 +32,9 @@ class Skill:
         name -- the name of the skill
         skill_module_path -- the path to the skill module
         skills -- a dictionary of skills
-        features -- a dictionary of features"""
+        features -- a dictionary of features
+        examples -- example utterances that should be routed to the skill"""
+    examples: List[str] = []
 
     def __call__(self, *args, **kwargs) -> Any:
         return self.call_feature(*args, **kwargs)
@@ -54,33 +62,49 @@ class Skill:
         func.requires_prompt = True
         return func
 
+    def __init_subclass__(cls, **kwargs):
+        """Build the dispatch table of a skill class once, when the class is created.
+        The table maps each feature name to the keyword arguments it accepts, or None if it accepts any."""
+        super().__init_subclass__(**kwargs)
+        feature_table = {}
+        for feature_name in dir(cls):
+            feature = getattr(cls, feature_name)
+            if callable(feature) and hasattr(feature, "is_skill_feature"):
+                parameters = inspect.signature(feature).parameters.values()
+                if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+                    feature_table[feature_name] = None
+                else:
+                    feature_table[feature_name] = frozenset(
+                        parameter.name for parameter in parameters
+                        if parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY))
+        cls.feature_table = MappingProxyType(feature_table)
+
+    @property
+    def bound_features(self) -> Mapping[str, Callable[..., Any]]:
+        """The features of the skill bound to this instance, built on first access."""
+        bound_features = self.__dict__.get("_bound_features")
+        if bound_features is None:
+            bound_features = MappingProxyType({feature_name: getattr(self, feature_name)
+                                               for feature_name in self.feature_table})
+            self.__dict__["_bound_features"] = bound_features
+        return bound_features
+
     def load_feature(self, feature_name: str) -> Any:
-        if hasattr(self, feature_name):
-            feature = getattr(self, feature_name)
-            if callable(feature):
-                return feature
-            else:
-                raise TypeError(f"Feature {feature_name} is not callable.")
-        else:
-            raise NotImplementError(feature_name)
+        try:
+            return self.bound_features[feature_name]
+        except KeyError:
+            raise NotImplementError(feature_name) from None
 
     def call_feature(self, feature_name: str, *args, **kwargs) -> Any:
-        if hasattr(self, feature_name):
-            feature = getattr(self, feature_name)
-            if callable(feature):
-                feature_args = feature.__code__.co_varnames[:feature.__code__.co_argcount]
-                if all(arg in feature_args for arg in kwargs):
-                    return feature(*args, **kwargs)
-                else:
-                    raise TypeError(
-                        f"Feature {feature_name} does not accept arguments {kwargs.keys()}. Expected {feature_args}.")
-            else:
-                raise TypeError(f"Feature {feature_name} is not callable.")
-        else:
-            raise NotImplementError(feature_name)
-        
+        feature = self.load_feature(feature_name)
+        feature_args = self.feature_table[feature_name]
+        if feature_args is not None and not feature_args.issuperset(kwargs):
+            raise TypeError(
+                f"Feature {feature_name} does not accept arguments {kwargs.keys()}. Expected {tuple(feature_args)}.")
+        return feature(*args, **kwargs)
+
     def get_features(self):
-        return [feature_name for feature_name in dir(self) if callable(getattr(self, feature_name)) and hasattr(getattr(self, feature_name), "is_skill_feature")]
+        return list(self.feature_table)
 
 
 class FallBackSkill(Skill):
@@ -95,56 +119,187 @@ class FallBackSkill(Skill):
         return "I'm sorry, I don't know how to do that."
 
 
+MANIFEST_PATH = Path("alara/skills/manifest.json")
+
+
 class SkillManager:
     """Class for managing skills.
     Skill Manager is responsible for loading skills and calling features.
+    Skills are discovered from a manifest describing their features, so skill modules are only imported when
+    a skill is loaded. Manifest entries are regenerated for skills whose source file changed.
     Attributes:
         skill_module_path (str): the path to the skill module
         skills (Dict[str, str]): a dictionary of skills
-        features (Dict[str, Any]): a dictionary of features"""
+        features (Dict[str, Any]): a dictionary of features
+        manifest (Dict[str, dict]): the manifest entry of each skill
+        pending (Dict[str, Future]): the skills that are being constructed, eg. by the preloading pool"""
 
-    def __init__(self):
+    def __init__(self, preload_workers: int = 2):
         self.skill_module_path = "alara.skills."
         self.skills: Dict[str, str] = {}
         self.features: Dict[str, Any] = {}
         self.loaded_skills: Dict[str, Skill] = {}
+        self.listeners: List[Callable[[str], None]] = []
+        self.manifest: Dict[str, dict] = {}
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.preload_workers = preload_workers
+        self.executor: Optional[ThreadPoolExecutor] = None
         self.dynamic_load_skill()
         logger.info("Skill Manager initialized.")
 
+    @staticmethod
+    def source_hash(skill_file: Path) -> str:
+        """Hash the source file of a skill.
+        Args:
+            skill_file (Path): the path to the skill module
+        Returns:
+            str: the hex digest of the file"""
+        return hashlib.sha256(skill_file.read_bytes()).hexdigest()
+
+    @staticmethod
+    def load_manifest() -> Dict[str, dict]:
+        """Load the skill manifest.
+        Returns:
+            Dict[str, dict]: the manifest entries keyed by skill name, empty if there is no manifest yet"""
+        try:
+            with open(MANIFEST_PATH, "r") as file:
+                return json.load(file)["skills"]
+        except (IOError, ValueError, KeyError):
+            return {}
+
+    def save_manifest(self):
+        """Save the skill manifest."""
+        try:
+            with open(MANIFEST_PATH, "w") as file:
+                json.dump({"skills": self.manifest}, file, indent=4)
+        except IOError as e:
+            logger.warning(f"Failed to save skill manifest: {e}")
+
+    @staticmethod
+    def describe_skill(skill_name: str, module_path: str, skill: type, source_hash: str) -> dict:
+        """Build the manifest entry of a skill class.
+        Args:
+            skill_name (str): the name of the skill
+            module_path (str): the module the skill is defined in
+            skill (type): the skill class
+            source_hash (str): the hash of the skill module
+        Returns:
+            dict: the manifest entry"""
+        features = []
+        for feature_name in skill.feature_table:
+            feature = getattr(skill, feature_name)
+            docstring = (feature.__doc__ or "").strip()
+            features.append({"name": feature_name,
+                             "signature": str(inspect.signature(feature)),
+                             "docstring": docstring,
+                             "description": docstring.split("\n")[0]})
+        return {"name": skill_name,
+                "module": module_path,
+                "class": skill.__name__,
+                "source_hash": source_hash,
+                "eager_load": getattr(skill, "eager_load", False) is True,
+                "examples": list(skill.examples),
+                "features": features}
+
+    def inspect_skill(self, skill_name: str, module_path: str, source_hash: str, reload: bool = False) -> Optional[dict]:
+        """Import a skill module and build its manifest entry.
+        Args:
+            skill_name (str): the name of the skill
+            module_path (str): the module the skill is defined in
+            source_hash (str): the hash of the skill module
+            reload (bool): whether to reload the module if it has already been imported
+        Returns:
+            dict | None: the manifest entry, or None if the skill could not be imported"""
+        logger.info(f"Inspecting skill {skill_name} from {module_path}")
+        try:
+            module = importlib.import_module(module_path)
+            if reload:
+                module = importlib.reload(module)
+        except ImportError as e:
+            logger.warning(f"Failed to import skill {skill_name}: {e}")
+            return None
+        for attr_name in dir(module):
+            attr = getattr(module, attr_name)
+            if isinstance(attr, type) and issubclass(attr, Skill) and attr != Skill:
+                return self.describe_skill(skill_name, module_path, attr, source_hash)
+        logger.warning(f"Skill {skill_name} not found in module.")
+        return None
+
     def dynamic_load_skill(self):
-        """Load skills dynamically from the skills directory.
+        """Discover skills from the manifest, inspecting only the skills that are new or whose source changed.
         Returns:
             Dict[str, str]: a dictionary of skills"""
         self.skills_dir = Path("alara/skills")
         logger.info(f"Loading skills from {self.skills_dir}")
         self.skill_mapping = {"skills": []}
+        manifest = self.load_manifest()
+        changed = False
         for skill_dir in self.skills_dir.iterdir():
-            if skill_dir.is_dir():
-                skill_module_path = f"{self.skills_dir.as_posix().replace('/', '.')}.{skill_dir.name}.skill"
-                self.skills[skill_dir.name] = skill_module_path
-                logger.info(f"Loaded skill {skill_dir.name} from {skill_module_path}")
-                try:
-                    module = importlib.import_module(skill_module_path)
-                    skills = [getattr(module, attr_name) for attr_name in dir(module)
-                              if isinstance(getattr(module, attr_name), type) and issubclass(getattr(module, attr_name), Skill) and getattr(module, attr_name) != Skill]
-                    for skill in skills:
-                        if hasattr(skill, "eager_load") and skill.eager_load == True:
-                            self.load_skill(skill_dir.name) # eager load the skill
-                        feature_names = [feature_name for feature_name in dir(skill) if
-                                         callable(getattr(skill, feature_name)) and hasattr(
-                                             getattr(skill, feature_name), "is_skill_feature")]
-                        self.features.update({feature_name: skill_dir.name for feature_name in feature_names})
-                        self.skill_mapping["skills"].append({"name": skill_dir.name,
-                                                             "features": [
-                                                                 {"name": feature_name} for feature_name in feature_names]})
-                except ImportError as e:
-                    logger.warning(f"Failed to import skill {skill_dir.name}: {e}")
-                except AttributeError:
-                    logger.warning(f"Skill {skill_dir.name} not found in module.")
+            skill_file = skill_dir / "skill.py"
+            if not skill_file.is_file():
+                continue
+            skill_module_path = f"{self.skills_dir.as_posix().replace('/', '.')}.{skill_dir.name}.skill"
+            source_hash = self.source_hash(skill_file)
+            entry = manifest.get(skill_dir.name)
+            if entry is None or entry.get("source_hash") != source_hash:
+                entry = self.inspect_skill(skill_dir.name, skill_module_path, source_hash)
+                changed = True
+                if entry is None:
+                    continue
+            self.skills[skill_dir.name] = skill_module_path
+            self.register_skill(skill_dir.name, entry)
+            logger.info(f"Loaded skill {skill_dir.name} from {skill_module_path}")
+        if changed or set(manifest) != set(self.manifest):
+            self.save_manifest()
+        for skill_name, entry in self.manifest.items():
+            if entry["eager_load"]:
+                self.load_skill(skill_name) # eager load the skill
         logger.info(f"Loaded skills: {self.skills}")
         logger.info(f"Loaded features: {self.features}")
         print(self.skill_mapping)
 
+    def register_skill(self, skill_name: str, entry: dict) -> None:
+        """Add the features of a skill to the registry.
+        Args:
+            skill_name (str): the name of the skill
+            entry (dict): the manifest entry of the skill"""
+        self.manifest[skill_name] = entry
+        self.features.update({feature["name"]: skill_name for feature in entry["features"]})
+        self.skill_mapping["skills"].append({"name": skill_name,
+                                             "examples": entry["examples"],
+                                             "features": [
+                                                 {"name": feature["name"],
+                                                  "description": feature["description"]}
+                                                 for feature in entry["features"]]})
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """Register a callback that is called with the skill name whenever a skill changes in the registry.
+        Used to invalidate caches derived from the registry, eg. intent labels and grammars.
+        Args:
+            callback (Callable[[str], None]): the callback"""
+        self.listeners.append(callback)
+
+    def reload_skill(self, skill_name: str) -> None:
+        """Reload a skill module from disk and refresh its entry in the registry.
+        Args:
+            skill_name (str): the name of the skill"""
+        if skill_name not in self.skills:
+            raise NotImplementError(skill_name)
+        skill_file = Path(*self.skills[skill_name].split(".")).with_suffix(".py")
+        entry = self.inspect_skill(skill_name, self.skills[skill_name], self.source_hash(skill_file), reload=True)
+        if entry is None:
+            return
+        with self.lock:
+            self.loaded_skills.pop(skill_name, None)
+        self.features = {feature_name: name for feature_name, name in self.features.items() if name != skill_name}
+        self.skill_mapping["skills"] = [skill for skill in self.skill_mapping["skills"] if skill["name"] != skill_name]
+        self.register_skill(skill_name, entry)
+        self.save_manifest()
+        logger.info(f"Reloaded skill {skill_name}")
+        for listener in self.listeners:
+            listener(skill_name)
+
     def call_feature(self, feature_name: str, *args, **kwargs) -> Any:
         """Call a feature.
         Args:
@@ -158,28 +313,108 @@ class SkillManager:
         else:
             raise NotImplementError(feature_name)
 
-    def load_skill(self, skill_name: str) -> Skill:
-        """Load a skill.
+    def construct_skill(self, skill_name: str) -> Skill:
+        """Import the module of a skill and instantiate the skill.
         Args:
             skill_name (str): the name of the skill
         Returns:
             Skill: the skill object"""
-        if skill_name not in self.skills:
-            raise NotImplementError(skill_name)
-        if skill_name in self.loaded_skills:
-            return self.loaded_skills[skill_name]
         skill_module_path = self.skills[skill_name]
         module = importlib.import_module(skill_module_path)
-        for attr_name in dir(module):
-            attr = getattr(module, attr_name)
-            if isinstance(attr, type) and issubclass(attr, Skill) and attr != Skill:
-                skill = attr()
-                self.loaded_skills[skill_name] = skill
-                return skill
-
+        attr = getattr(module, self.manifest[skill_name]["class"], None)
+        if isinstance(attr, type) and issubclass(attr, Skill):
+            return attr()
         logger.info(f"Skill {skill_name} not found in module {skill_module_path}")
         return FallBackSkill()
 
+    def run_construction(self, skill_name: str, future: Future):
+        """Construct a skill and resolve its future.
+        Args:
+            skill_name (str): the name of the skill
+            future (Future): the future tracking the construction"""
+        try:
+            skill = self.construct_skill(skill_name)
+        except BaseException as e:
+            with self.lock:
+                self.pending.pop(skill_name, None)
+            future.set_exception(e)
+            return
+        with self.lock:
+            if not isinstance(skill, FallBackSkill):
+                self.loaded_skills[skill_name] = skill
+            self.pending.pop(skill_name, None)
+        future.set_result(skill)
+
+    def claim_skill(self, skill_name: str) -> tuple[Future, bool]:
+        """Get the future of a skill, creating it if the skill is neither loaded nor being constructed.
+        Args:
+            skill_name (str): the name of the skill
+        Returns:
+            tuple[Future, bool]: the future, and whether the caller is responsible for constructing the skill"""
+        if skill_name not in self.skills:
+            raise NotImplementError(skill_name)
+        with self.lock:
+            if skill_name in self.loaded_skills:
+                future = Future()
+                future.set_result(self.loaded_skills[skill_name])
+                return future, False
+            if skill_name in self.pending:
+                return self.pending[skill_name], False
+            future = Future()
+            self.pending[skill_name] = future
+            return future, True
+
+    def preload_skill(self, skill_name: str) -> Future:
+        """Construct a skill in the background, eg. a skill that is likely to be requested soon.
+        Args:
+            skill_name (str): the name of the skill
+        Returns:
+            Future: resolves to the skill object once it is constructed"""
+        future, owner = self.claim_skill(skill_name)
+        if owner:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.preload_workers,
+                                                       thread_name_prefix="skill-preload")
+            logger.info(f"Preloading skill {skill_name}")
+            self.executor.submit(self.run_construction, skill_name, future)
+        return future
+
+    def preload_skills(self, skill_names: List[str]) -> Dict[str, Future]:
+        """Construct several skills in the background.
+        Args:
+            skill_names (List[str]): the names of the skills, '*' preloads every skill
+        Returns:
+            Dict[str, Future]: the future of each skill"""
+        if "*" in skill_names:
+            skill_names = list(self.skills)
+        futures = {}
+        for skill_name in skill_names:
+            if skill_name not in self.skills:
+                logger.warning(f"Cannot preload unknown skill {skill_name}")
+                continue
+            futures[skill_name] = self.preload_skill(skill_name)
+        return futures
+
+    def load_skill(self, skill_name: str) -> Skill:
+        """Load a skill.
+        If the skill is being preloaded, wait for it instead of constructing it a second time.
+        Args:
+            skill_name (str): the name of the skill
+        Returns:
+            Skill: the skill object"""
+        future, owner = self.claim_skill(skill_name)
+        if owner:
+            self.run_construction(skill_name, future)
+        return future.result()
+
+    def shutdown(self):
+        """Stop the preloading pool."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
 if __name__ == "__main__":
     skill_manager = SkillManager()
     skill_manager.call_feature("current_weather")
@@ -17,6 +17,7 @@ class Weather(Skill):
         BASE_URL: The base URL for the Visual Crossing Weather API."""
     WEATHER_API_KEY = cfg.VISUAL_CROSSING_API_KEY
     BASE_URL = 'https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/'
+    examples = ["What's the weather like today?", "Will it rain tomorrow?", "How hot is it outside?"]
 
     def __init__(self):
         """Initialize the Weather skill.
@@ -94,6 +95,5 @@ class Weather(Skill):
         }
         for key, value in report_items.items():
             weather_report += f"{key}: {value}\n"
-        summary = self.llm.chat_completion(self.weather_prompt, weather_report)
-        self.tts.synthesize(summary)
+        summary = self.tts.synthesize_stream(self.llm.stream_chat_completion(self.weather_prompt, weather_report))
         return summary
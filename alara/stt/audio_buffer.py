@@ -0,0 +1,59 @@
+import numpy as np
+
+
+class AudioRingBuffer:
+    """A fixed-capacity ring buffer of audio samples backed by preallocated NumPy storage.
+    Every sample is written twice, at its position and one capacity further, so the most recent
+    samples are always contiguous and can be exported as a view without copying.
+    Attributes:
+        capacity: int: The maximum number of samples held by the buffer.
+        data: np.ndarray: The mirrored storage of shape (2 * capacity, channels).
+        write_index: int: The position of the next write in [0, capacity).
+        size: int: The number of valid samples in the buffer.
+        total: int: The number of samples written since the buffer was created."""
+
+    def __init__(self, capacity: int, channels: int = 1, dtype=np.float32):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, channels), dtype=dtype)
+        self.write_index = 0
+        self.size = 0
+        self.total = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, block: np.ndarray):
+        """Append a block of samples, overwriting the oldest samples once the buffer is full.
+        Args:
+            block: np.ndarray: The samples to append, of shape (frames, channels)."""
+        frames = len(block)
+        self.total += frames
+        if frames >= self.capacity:
+            block = block[-self.capacity:]
+            frames = self.capacity
+        first = min(frames, self.capacity - self.write_index)
+        start = self.write_index
+        self.data[start:start + first] = block[:first]
+        self.data[start + self.capacity:start + self.capacity + first] = block[:first]
+        rest = frames - first
+        if rest:
+            self.data[:rest] = block[first:]
+            self.data[self.capacity:self.capacity + rest] = block[first:]
+        self.write_index = (self.write_index + frames) % self.capacity
+        self.size = min(self.size + frames, self.capacity)
+
+    def latest(self, frames: int | None = None) -> np.ndarray:
+        """Get a view of the most recent samples.
+        The view shares memory with the buffer, so it stays valid only until the buffer wraps around;
+        copy it if it has to outlive further appends.
+        Args:
+            frames: int: The number of samples to return. Defaults to all valid samples.
+        Returns:
+            np.ndarray: The most recent samples, oldest first."""
+        frames = self.size if frames is None else min(frames, self.size)
+        end = self.write_index + self.capacity
+        return self.data[end - frames:end]
+
+    def clear(self):
+        """Discard the buffered samples without touching the storage."""
+        self.size = 0
@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+import sounddevice as sd
+from alara.lib.logger import logger
+from alara.lib.singleton import Singleton
+from alara.stt.audio_buffer import AudioRingBuffer
+
+
+class AudioCapture(metaclass=Singleton):
+    """A single microphone capture shared by the wake word model and speech recognition.
+    The capture stream stays open and publishes 16 kHz float32 frames into a shared ring buffer,
+    consumers read from it through their own AudioReader cursor.
+    Attributes:
+        buffer: AudioRingBuffer: The most recent captured audio.
+        condition: threading.Condition: Notified whenever a block has been captured.
+        stream: sd.InputStream: The microphone input stream."""
+    SAMPLE_RATE = 16000  # Capture frequency, as expected by openwakeword and Whisper
+    BLOCK_SIZE = 80  # Block size in milliseconds
+    BUFFER_SIZE = 60  # Seconds of audio kept for consumers and pre-roll
+
+    def __init__(self):
+        self.buffer = AudioRingBuffer(self.SAMPLE_RATE * self.BUFFER_SIZE)
+        self.condition = threading.Condition()
+        self.stream = None
+
+    @property
+    def position(self) -> int:
+        """The number of samples captured since the capture started."""
+        return self.buffer.total
+
+    def start(self):
+        """Open the microphone stream if it is not open yet."""
+        if self.stream is not None:
+            return
+        logger.info("Initializing microphone stream")
+        self.stream = sd.InputStream(channels=1, callback=self.callback, dtype='float32',
+                                     blocksize=int(self.SAMPLE_RATE * self.BLOCK_SIZE / 1000),
+                                     samplerate=self.SAMPLE_RATE)
+        self.stream.start()
+
+    def stop(self):
+        """Close the microphone stream and wake up any waiting consumer."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        with self.condition:
+            self.condition.notify_all()
+
+    def callback(self, indata, frames, time, status):
+        with self.condition:
+            self.buffer.append(indata)
+            self.condition.notify_all()
+
+    def reader(self, start_position: int | None = None) -> 'AudioReader':
+        """Create a reader over the captured audio, starting the capture if needed.
+        Args:
+            start_position: int: The sample position to start reading from. Earlier positions give pre-roll
+                audio that was captured before the reader was created. Defaults to the current position.
+        Returns:
+            AudioReader: The reader."""
+        self.start()
+        return AudioReader(self, self.position if start_position is None else start_position)
+
+
+class AudioReader:
+    """A consumer cursor over the shared AudioCapture buffer.
+    Attributes:
+        capture: AudioCapture: The shared capture.
+        position: int: The sample position of the next read."""
+
+    def __init__(self, capture: AudioCapture, position: int):
+        self.capture = capture
+        self.position = position
+
+    def read(self, frames: int, timeout: float | None = None) -> np.ndarray | None:
+        """Read the next block of audio, waiting until it has been captured.
+        If the reader fell further behind than the buffer holds, it skips ahead to the oldest buffered audio.
+        Args:
+            frames: int: The number of samples to read.
+            timeout: float: The maximum number of seconds to wait.
+        Returns:
+            np.ndarray | None: A copy of the samples of shape (frames, 1), or None on timeout."""
+        capture = self.capture
+        with capture.condition:
+            if not capture.condition.wait_for(lambda: capture.position - self.position >= frames
+                                              or capture.stream is None, timeout):
+                return None
+            if capture.stream is None:
+                return None
+            self.position = max(self.position, capture.position - len(capture.buffer))
+            available = capture.position - self.position
+            block = capture.buffer.latest(available)[:frames].copy()
+        self.position += len(block)
+        return block
@@ -1,18 +1,28 @@
 # Imports
-import pyaudio
+import threading
+from contextlib import contextmanager
 import numpy as np
 import openwakeword.utils as utils
 from openwakeword.model import Model
 import logging
 from rich import print
 from alara.lib.logger import logger
+from alara.config.config import cfg
+from alara.stt.audio_capture import AudioCapture
 
 
 class WakeWord:
     def __init__(self, model_path="alara/stt/Alara.onnx", inference_framework="onnx", chunk_size=1280):
         self.chunk_size = chunk_size
         self.model = self.load_model(model_path, inference_framework)
-        self.mic_stream = self.get_mic_stream()
+        self.reader = AudioCapture().reader()
+        self.detected_position = None
+        self.listening = True
+        self.threshold = cfg.WAKEWORD_THRESHOLD
+        self.playback_threshold = cfg.WAKEWORD_PLAYBACK_THRESHOLD
+        # [start, end, threshold] ranges of capture positions, end is None while playback goes on
+        self.raised: list[list] = []
+        self.raised_lock = threading.Lock()
 
     def load_model(self, model_path, inference_framework="onnx"):
         logger.info(f"Loading wakeword model from {model_path}")
@@ -23,19 +33,41 @@ class WakeWord:
             owwModel = Model(wakeword_models=[model_path], inference_framework=inference_framework)
         return owwModel
 
-    def get_mic_stream(self):
-        logger.info("Initializing microphone stream")
-        FORMAT = pyaudio.paInt16
-        CHANNELS = 1
-        RATE = 16000
-        audio = pyaudio.PyAudio()
-        mic_stream = audio.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True,
-                                frames_per_buffer=self.chunk_size)
-        return mic_stream
+    @contextmanager
+    def raise_threshold(self, threshold: float):
+        """Require a higher wakeword score in the audio captured inside the block.
+        Args:
+            threshold: float: The score the wakeword has to exceed."""
+        span = [AudioCapture().position, None, threshold]
+        with self.raised_lock:
+            self.raised.append(span)
+        try:
+            yield
+        finally:
+            with self.raised_lock:
+                span[1] = AudioCapture().position
+
+    def playback(self):
+        """Detect the wakeword at the stricter playback threshold inside the block, while the agent speaks.
+        The speaker's echo of a response that says the wakeword scores lower than the user saying it
+        into the microphone, so the user can still barge in without the agent interrupting itself."""
+        return self.raise_threshold(self.playback_threshold)
+
+    def mute(self):
+        """Ignore the wakeword in the audio captured inside the block, eg. during the short greeting."""
+        return self.raise_threshold(float('inf'))
+
+    def threshold_at(self, position: int) -> float:
+        """The score the wakeword has to exceed at a capture position, forgetting the ranges already read past."""
+        with self.raised_lock:
+            self.raised = [span for span in self.raised if span[1] is None or span[1] > position]
+            return max([self.threshold] + [threshold for start, _, threshold in self.raised if start <= position])
 
     def predict_wakeword(self):
-        audio = np.frombuffer(self.mic_stream.read(self.chunk_size), dtype=np.int16)
-        return self.model.predict(audio)
+        audio = self.reader.read(self.chunk_size)
+        if audio is None:
+            return {}
+        return self.model.predict((audio[:, 0] * 32767).astype(np.int16))
 
     def print_wakeword_status(self):
         while True:
@@ -62,14 +94,24 @@ class WakeWord:
     def wake_word_detection(self):
         logger.info("Listening for wakeword..")
         print("Say 'Alara' to initiate voice assistant..")
-        while True:
+        # skip audio captured while the agent was busy with the previous turn
+        self.reader.position = AudioCapture().position
+        while self.listening:
             self.predict_wakeword()
             for mdl in self.model.prediction_buffer.keys():
                 scores = list(self.model.prediction_buffer[mdl])
-                if scores[-1] > 0.5:
+                if scores[-1] > self.threshold:
+                    if scores[-1] <= self.threshold_at(self.reader.position):
+                        continue
                     print(f"Wakeword detected! '{mdl}' with score {scores[-1]}")
                     logger.info(f"Wakeword detected! '{mdl}' with score {scores[-1]}")
+                    self.detected_position = self.reader.position
                     return True
+        return False
+
+    def stop(self):
+        """Stop the wakeword detection loop, eg. when the agent shuts down."""
+        self.listening = False
 
     def clear_wakeword_buffer(self):
         """Clears the prediction buffer of the wakeword model.
@@ -1,27 +1,32 @@
-import os
 import threading
 
 import numpy as np
-import sounddevice as sd
 from faster_whisper import WhisperModel
-from scipy.io.wavfile import write
+from scipy.signal import resample_poly
+from alara.stt.audio_buffer import AudioRingBuffer
+from alara.stt.audio_capture import AudioCapture
 
 
 class StreamHandler:
     MODEL = 'small.en'
     #ENGLISH = True # No longer needed
     #TRANSLATE = False # No longer needed
-    SAMPLE_RATE = 44100  # Stream device recording frequency
+    SAMPLE_RATE = AudioCapture.SAMPLE_RATE  # Shared capture frequency
+    WHISPER_SAMPLE_RATE = 16000  # Sample rate expected by Whisper
     BLOCK_SIZE = 110  # Block size in milliseconds
     THRESHOLD = 0.05  # Minimum volume threshold to activate listening
     VOCALS = [50, 1000]  # Frequency range to detect sounds that could be speech
     END_BLOCKS = 30  # Number of blocks to wait before sending to Whisper
+    MAX_UTTERANCE = 30  # Maximum length of an utterance in seconds
 
     def __init__(self, assist=None, timeout=10, on_timeout=None):
         self.asst = assist if assist else {'running': True, 'talking': False, 'analyze': None}
         self.padding = 0
-        self.prevblock = self.buffer = np.zeros((0, 1))
-        self.fileready = False
+        self.block_frames = int(self.SAMPLE_RATE * self.BLOCK_SIZE / 1000)
+        self.buffer = AudioRingBuffer(self.SAMPLE_RATE * self.MAX_UTTERANCE)
+        self.prevblock = np.zeros((self.block_frames, 1), dtype=np.float32)
+        self.prevblock_frames = 0
+        self.utterance = None
         print("\033[96mLoading Whisper Model..\033[0m", end='', flush=True)
         self.model = WhisperModel(f'{self.MODEL}', device="cpu", compute_type="int8")
         print("\033[90m Done.\033[0m")
@@ -43,17 +48,26 @@ class StreamHandler:
         print("\n\033[31mTimeout\033[0m")
 
     def callback(self, indata, frames, time, status):
-        if not any(indata):
+        if not indata.any():
             print('\033[31m.\033[0m', end='', flush=True)
             return
         self.process_input(indata, frames)
 
-    def process_input(self, indata, frames):
+    def is_speech(self, indata, frames) -> bool:
+        """Check whether a block could be speech.
+        The cheap energy gate runs first, the FFT only runs for blocks loud enough to be speech."""
+        if self.asst['talking'] or np.sqrt(np.mean(indata ** 2)) <= self.THRESHOLD:
+            return False
         freq = np.argmax(np.abs(np.fft.rfft(indata[:, 0]))) * self.SAMPLE_RATE / frames
-        if np.sqrt(np.mean(indata ** 2)) > self.THRESHOLD and self.VOCALS[0] <= freq <= self.VOCALS[1] and not \
-        self.asst['talking']:
+        return self.VOCALS[0] <= freq <= self.VOCALS[1]
+
+    def process_input(self, indata, frames):
+        if self.is_speech(indata, frames):
             print('.', end='', flush=True)
-            self.buffer = self.prevblock.copy() if self.padding < 1 else np.concatenate((self.buffer, indata))
+            if self.padding < 1:
+                self.buffer.clear()
+                self.buffer.append(self.prevblock[:self.prevblock_frames])
+            self.buffer.append(indata)
             self.padding = self.END_BLOCKS
             if self.timer is not None:
                 self.timer.cancel()
@@ -64,36 +78,59 @@ class StreamHandler:
     def process_silence(self, indata):
         self.padding -= 1
         if self.padding > 1:
-            self.buffer = np.concatenate((self.buffer, indata))
-        elif self.padding < 1 < self.buffer.shape[0] > self.SAMPLE_RATE:
-            self.fileready = True
-            write('dictate.wav', self.SAMPLE_RATE, self.buffer)
-            self.buffer = np.zeros((0, 1))
-        elif self.padding < 1 < self.buffer.shape[0] < self.SAMPLE_RATE:
-            self.buffer = np.zeros((0, 1))
+            self.buffer.append(indata)
+        elif self.padding < 1 < len(self.buffer) > self.SAMPLE_RATE:
+            self.utterance = self.buffer.latest()
+            self.buffer.clear()
+        elif self.padding < 1 < len(self.buffer) < self.SAMPLE_RATE:
+            self.buffer.clear()
             print("\033[2K\033[0G", end='', flush=True)
         else:
-            self.prevblock = indata.copy()
+            self.prevblock_frames = min(len(indata), self.block_frames)
+            self.prevblock[:self.prevblock_frames] = indata[:self.prevblock_frames]
+
+    def resample(self, audio: np.ndarray) -> np.ndarray:
+        """Convert captured audio to the mono float32 16 kHz signal Whisper expects."""
+        if self.SAMPLE_RATE == self.WHISPER_SAMPLE_RATE:
+            return audio[:, 0].astype(np.float32)
+        gcd = np.gcd(self.SAMPLE_RATE, self.WHISPER_SAMPLE_RATE)
+        audio = resample_poly(audio[:, 0], self.WHISPER_SAMPLE_RATE // gcd, self.SAMPLE_RATE // gcd)
+        return audio.astype(np.float32)
 
-    def listen(self) -> str | None:
+    def listen(self, start_position: int | None = None, muted: tuple[int, int] | None = None,
+               stop_event: threading.Event | None = None) -> str | None:
+        """Listen for an utterance on the shared audio capture and transcribe it.
+        Args:
+            start_position: The capture position to start from, eg. where the wake word was detected,
+                to include speech that started before listening. Defaults to the current position.
+            muted: A (start, end) range of capture positions to treat as silence, eg. while the agent was speaking.
+            stop_event: Ends this call once set. Unlike stop_listening, it is not reset by the next call,
+                so a stop requested before listening started is not lost.
+        Returns:
+            str | None: The transcription, or None if listening timed out or was stopped."""
         print("\033[32mListening.. \033[37m(Ctrl+C to Quit)\033[0m")
         self.asst['running'] = True
-        with sd.InputStream(channels=1, callback=self.callback,
-                            blocksize=int(self.SAMPLE_RATE * self.BLOCK_SIZE / 1000), samplerate=self.SAMPLE_RATE):
-            print("getting input stream")
-            if self.timer is None:
-                print("Starting timer")
-                self.start_timer()
-            while self.asst['running']:
-                if self.fileready:
-                    print("\n\033[90mTranscribing..\033[0m")
-                    results, _ = self.model.transcribe('dictate.wav', beam_size=5)
-                    results = ' '.join([result.text for result in results])
-                    print(f"\033[1A\033[2K\033[0G{results}")
-                    if self.asst['analyze']: self.asst['analyze'](results)
-                    self.fileready = False
-                    os.remove('dictate.wav')
-                    return results
+        reader = AudioCapture().reader(start_position)
+        if self.timer is None:
+            print("Starting timer")
+            self.start_timer()
+        while self.asst['running'] and not (stop_event is not None and stop_event.is_set()):
+            # blocks until the capture thread has published the next block
+            block = reader.read(self.block_frames, timeout=self.timeout)
+            if block is None:
+                continue
+            if muted is not None and muted[0] <= reader.position - len(block) < muted[1]:
+                self.process_silence(block)
+            else:
+                self.callback(block, len(block), None, None)
+            if self.utterance is not None:
+                print("\n\033[90mTranscribing..\033[0m")
+                audio, self.utterance = self.utterance, None
+                results, _ = self.model.transcribe(self.resample(audio), beam_size=5)
+                results = ' '.join([result.text for result in results])
+                print(f"\033[1A\033[2K\033[0G{results}")
+                if self.asst['analyze']: self.asst['analyze'](results)
+                return results
                     
         return None
 
@@ -1,13 +1,18 @@
 from datetime import datetime
+import threading
 import chromadb
+import numpy as np
+from chromadb.api.models.Collection import Collection
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 from uuid import uuid4
 from pydantic import BaseModel, Field
 from enum import Enum
 from typing import List, Dict, Any, Optional
+from alara.lib.singleton import Singleton
 from alara.tools.base_tool import Tool, ToolKit
 from alara.tools.text_parser.text_splitter import split_text
+from alara.tools.memory.chroma.embedding_cache import EmbeddingCache
 
 class MemoryType(str, Enum):
     THOUGHT = 'thought'
@@ -30,6 +35,11 @@ class Memory(BaseModel):
 PERSISTENT_DIRECTORY = '/hestia/tools/memory/chroma/db/'
 COLLECTION_NAME = 'Alara_Memories'
 MODEL_NAME = 'all-MiniLM-L6-v2'
+SIMILARITY_WEIGHT = 0.7
+RECENCY_WEIGHT = 0.2
+TYPE_WEIGHT = 0.1
+RECENCY_HALF_LIFE = 30 * 24 * 3600  # Seconds after which the recency score of a memory halves
+MEMORY_TYPE_WEIGHTS = {MemoryType.KNOWLEDGE.value: 1.0, MemoryType.DIALOGUE.value: 0.8, MemoryType.THOUGHT.value: 0.6}
 
 class AddMemoryTool(Tool):
     def __init__(self):
@@ -39,8 +49,8 @@ class AddMemoryTool(Tool):
         self.dependencies = {}
         
     def run(self, memory: Memory):
-        client = ChromaDBClient()
-        client.add_memory(memory)
+        from alara.tools.memory.chroma.memory_writer import MemoryWriter
+        MemoryWriter().enqueue_memory(memory)
         return "Memory added successfully"
     
 class SearchMemoryTool(Tool):
@@ -50,9 +60,9 @@ class SearchMemoryTool(Tool):
         self.usage = "search_memory [query]"
         self.dependencies = {}
         
-    def run(self, query: str):
+    def run(self, query: str, memory_types: Optional[List[MemoryType]] = None, since: Optional[datetime] = None):
         client = ChromaDBClient()
-        results = client.search(query, top_k=1)
+        results = client.retrieve(query, memory_types=memory_types, since=since, top_k=1)
         return results
     
 class ChromaMemoryToolKit(ToolKit):
@@ -73,52 +83,177 @@ class ChromaMemoryToolKit(ToolKit):
     
     
 
-class ChromaDBClient():
+class ChromaDBClient(metaclass=Singleton):
+    """Process-wide memory store.
+    Owns a single persistent Chroma client and a single loaded embedding model, and caches the collection handles,
+    so adding or searching memories does not reopen the database or reload the model.
+    Attributes:
+        client: chromadb.PersistentClient: The Chroma client.
+        embedding_function: EmbeddingCache: The resident embedding model, behind an embedding cache.
+        collections: Dict[str, Collection]: The collection handles, keyed by name.
+        collection: Collection: The default memory collection.
+        lock: threading.RLock: Serializes access to the store across threads."""
     def __init__(self, persist_directory: str = PERSISTENT_DIRECTORY, collection_name: str = COLLECTION_NAME, model_name: str = MODEL_NAME):
         self.client = chromadb.PersistentClient(persist_directory, settings=Settings(allow_reset=True, anonymized_telemetry=False))
-        self.collection = self.client.get_or_create_collection(collection_name)
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(model_name)
-        
-    
-    def add_text(self, text: str, metadata: dict = {}, collection_name: str = COLLECTION_NAME):
-        metadata['timestamp'] = datetime.now().isoformat(sep=' ', timespec='minutes')
-        collection = self.client.get_or_create_collection(collection_name)
+        self.embedding_function = EmbeddingCache(
+            embedding_functions.SentenceTransformerEmbeddingFunction(model_name), namespace=model_name)
+        self.collections: Dict[str, Collection] = {}
+        self.lock = threading.RLock()
+        self.collection = self.get_collection(collection_name)
+
+    def get_collection(self, collection_name: str = COLLECTION_NAME) -> Collection:
+        """Get a collection handle, opening the collection on first use.
+        No embedding function is attached, so collections created before the store embedded explicitly keep the
+        default embedding function they were saved with and open without a conflict. Every add and query passes
+        its own embeddings. The default embedding function is the same all-MiniLM-L6-v2 model, so old and new
+        vectors share one space.
+        Args:
+            collection_name: str: The name of the collection.
+        Returns:
+            Collection: The collection."""
+        with self.lock:
+            collection = self.collections.get(collection_name)
+            if collection is None:
+                collection = self.client.get_or_create_collection(collection_name)
+                self.collections[collection_name] = collection
+            return collection
+
+    @staticmethod
+    def timestamp_metadata() -> dict:
+        """Build the time metadata of a new memory.
+        The numeric created_at field is what time window filters and recency scoring use,
+        since Chroma only compares numbers in where filters.
+        Returns:
+            dict: The readable timestamp and the creation time in seconds since the epoch."""
+        now = datetime.now()
+        return {'timestamp': now.isoformat(sep=' ', timespec='minutes'), 'created_at': now.timestamp()}
+
+    def add_text(self, text: str, metadata: Optional[dict] = None, collection_name: str = COLLECTION_NAME):
+        metadata = dict(metadata or {})
+        metadata.update(self.timestamp_metadata())
         texts = list(split_text(text))
-        collection.add(
-            documents=texts,
-            metadatas=[metadata for _ in range(len(texts))],
-            ids=[str(uuid4()) for _ in range(len(texts))],
-        )
+        self.add_documents(texts, [metadata for _ in range(len(texts))], collection_name)
         
     def search(self, query: str, collection_name: str = COLLECTION_NAME, top_k: int = 5):
-        collection = self.client.get_or_create_collection(collection_name)
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k
-        )
+        query_embeddings = self.embedding_function([query])
+        with self.lock:
+            results = self.get_collection(collection_name).query(
+                query_embeddings=query_embeddings,
+                n_results=top_k
+            )
 
         return results
-    
-    
-        
-    def add_memory(self, memory: Memory):
-        text = memory.content
-        texts = list(split_text(text))
-        
+
+    @staticmethod
+    def build_where(memory_types: Optional[List[MemoryType]] = None, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None) -> Optional[dict]:
+        """Build a Chroma where filter from the memory types and time window of a query.
+        Args:
+            memory_types: List[MemoryType]: The memory types to search, all types if None.
+            since: datetime: The earliest creation time to search.
+            until: datetime: The latest creation time to search.
+        Returns:
+            dict | None: The where filter, None if nothing is filtered."""
+        conditions = []
+        if memory_types:
+            conditions.append({'memory_type': {'$in': [MemoryType(memory_type).value for memory_type in memory_types]}})
+        if since is not None:
+            conditions.append({'created_at': {'$gte': since.timestamp()}})
+        if until is not None:
+            conditions.append({'created_at': {'$lte': until.timestamp()}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+    @staticmethod
+    def created_at(metadata: dict) -> float:
+        """Get the creation time of a memory, parsing the readable timestamp of memories stored without created_at.
+        Args:
+            metadata: dict: The metadata of the memory.
+        Returns:
+            float: The creation time in seconds since the epoch, 0 if unknown."""
+        if 'created_at' in metadata:
+            return float(metadata['created_at'])
+        try:
+            return datetime.fromisoformat(str(metadata['timestamp'])).timestamp()
+        except (KeyError, ValueError):
+            return 0.0
+
+    def retrieve(self, query: str, memory_types: Optional[List[MemoryType]] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, top_k: int = 5, candidates: Optional[int] = None,
+                 collection_name: str = COLLECTION_NAME) -> Dict[str, Any]:
+        """Retrieve memories by a combined similarity, recency and memory type score.
+        The memory type and time window are pushed down to Chroma as a where filter, so the vector search only runs
+        over matching memories. The nearest candidates are then re-ranked.
+        Args:
+            query: str: The query.
+            memory_types: List[MemoryType]: The memory types to search, all types if None.
+            since: datetime: The earliest creation time to search.
+            until: datetime: The latest creation time to search.
+            top_k: int: The number of memories to return.
+            candidates: int: The number of nearest memories to re-rank, 4 * top_k by default.
+            collection_name: str: The name of the collection.
+        Returns:
+            Dict[str, Any]: The ids, documents, metadatas, distances and scores of the memories, best first,
+                shaped like the results of a Chroma query."""
+        query_embeddings = self.embedding_function([query])
+        with self.lock:
+            results = self.get_collection(collection_name).query(
+                query_embeddings=query_embeddings,
+                n_results=candidates or 4 * top_k,
+                where=self.build_where(memory_types, since, until),
+                include=['documents', 'metadatas', 'distances']
+            )
+        ids, documents = results['ids'][0], results['documents'][0]
+        metadatas, distances = results['metadatas'][0], np.asarray(results['distances'][0], dtype=np.float32)
+        if not ids:
+            return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]], 'scores': [[]]}
+        created_at = np.fromiter((self.created_at(metadata) for metadata in metadatas), dtype=np.float64, count=len(ids))
+        type_weights = np.fromiter((MEMORY_TYPE_WEIGHTS.get(str(metadata.get('memory_type')), 0.0)
+                                    for metadata in metadatas), dtype=np.float32, count=len(ids))
+        similarity = 1.0 / (1.0 + distances)
+        age = np.maximum(datetime.now().timestamp() - created_at, 0.0)
+        recency = np.exp2(-age / RECENCY_HALF_LIFE).astype(np.float32)
+        scores = SIMILARITY_WEIGHT * similarity + RECENCY_WEIGHT * recency + TYPE_WEIGHT * type_weights
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return {'ids': [[ids[i] for i in order]],
+                'documents': [[documents[i] for i in order]],
+                'metadatas': [[metadatas[i] for i in order]],
+                'distances': [distances[order].tolist()],
+                'scores': [scores[order].tolist()]}
+
+    def add_documents(self, documents: List[str], metadatas: List[dict], collection_name: str = COLLECTION_NAME):
+        """Embed a batch of documents with a single forward pass and add them with a single insert.
+        Args:
+            documents: List[str]: The documents.
+            metadatas: List[dict]: The metadata of each document.
+            collection_name: str: The name of the collection."""
+        if not documents:
+            return
+        embeddings = self.embedding_function(documents)
+        with self.lock:
+            self.get_collection(collection_name).add(
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=[str(uuid4()) for _ in range(len(documents))],
+            )
+
+    @staticmethod
+    def memory_metadata(memory: Memory) -> dict:
+        """Build the metadata stored with the chunks of a memory.
+        Args:
+            memory: Memory: The memory.
+        Returns:
+            dict: The memory type, source and creation time of the memory."""
         metadata = memory.model_dump()
-        metadata['memory_type'] = memory.memory_type
+        metadata['memory_type'] = memory.memory_type.value
         metadata['source'] = memory.source
         metadata.pop('content')
-        metadata['timestamp'] = datetime.now().isoformat(sep=' ', timespec='minutes')
-        self.collection.add(
-            documents=texts,
-            metadatas=[metadata for _ in range(len(texts))],
-            ids=[str(uuid4()) for _ in range(len(texts))],
-        )
-        
-    
-        
-
+        metadata.update(ChromaDBClient.timestamp_metadata())
+        return metadata
 
-    
-    
\ No newline at end of file
+    def add_memory(self, memory: Memory):
+        texts = list(split_text(memory.content))
+        metadata = self.memory_metadata(memory)
+        self.add_documents(texts, [metadata for _ in range(len(texts))])
@@ -0,0 +1,148 @@
+import atexit
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from alara.config.config import cfg
+from alara.lib.logger import logger
+
+
+class EmbeddingCache:
+    """Content-addressed cache in front of an embedding function.
+    The cache is called directly by the memory store, which passes the embeddings to Chroma, so it is never attached
+    to a collection as a Chroma embedding function.
+    Texts are keyed by the hash of the model name and the text, so a repeated query or a re-added chunk skips the
+    model entirely. Recently used embeddings are kept in an in-memory LRU, and optionally in a NumPy memmap on disk
+    that survives restarts. Misses of a call are embedded together in a single call to the wrapped function.
+    Attributes:
+        embedding_function: Callable: The wrapped embedding function.
+        namespace: str: Distinguishes the embeddings of different models.
+        max_size: int: The maximum number of embeddings kept in memory.
+        entries: OrderedDict: The in-memory embeddings keyed by hash, least recently used first.
+        persist_dir: str: The directory of the memmap files, None to keep the cache in memory only.
+        disk_size: int: The number of embeddings the memmap holds, its slots are reused as a ring."""
+    KEY_DTYPE = 'S32'
+
+    def __init__(self, embedding_function: Callable[[List[str]], List[List[float]]], namespace: str,
+                 max_size: int = cfg.EMBEDDING_CACHE_SIZE, persist_dir: Optional[str] = cfg.EMBEDDING_CACHE_DIR or None,
+                 disk_size: int = cfg.EMBEDDING_CACHE_DISK_SIZE):
+        self.embedding_function = embedding_function
+        self.namespace = namespace
+        self.max_size = max_size
+        self.entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self.persist_dir = persist_dir
+        self.disk_size = disk_size
+        self.vectors: Optional[np.memmap] = None
+        self.keys: Optional[np.memmap] = None
+        self.slots: Dict[bytes, int] = {}
+        self.next_slot = 0
+        self.lock = threading.Lock()
+        if self.persist_dir:
+            self.open_memmap()
+            atexit.register(self.flush)
+
+    def key(self, text: str) -> bytes:
+        """Hash a text.
+        Args:
+            text: str: The text.
+        Returns:
+            bytes: The key of the text."""
+        return hashlib.blake2b(f"{self.namespace}\0{text}".encode(), digest_size=16).hexdigest().encode()
+
+    def memmap_paths(self) -> tuple[str, str]:
+        """The paths of the vectors and keys memmap files of the namespace."""
+        name = self.namespace.replace('/', '--')
+        return (os.path.join(self.persist_dir, f"{name}.vectors.npy"),
+                os.path.join(self.persist_dir, f"{name}.keys.npy"))
+
+    def open_memmap(self, dimensions: Optional[int] = None):
+        """Open the memmap files, creating them once the embedding dimensions are known.
+        Args:
+            dimensions: int: The size of an embedding, needed to create the files."""
+        vectors_path, keys_path = self.memmap_paths()
+        if os.path.exists(vectors_path) and os.path.exists(keys_path):
+            self.vectors = np.lib.format.open_memmap(vectors_path, mode='r+')
+            self.keys = np.lib.format.open_memmap(keys_path, mode='r+')
+            self.disk_size = len(self.keys)
+            self.slots = {key: slot for slot, key in enumerate(self.keys.tolist()) if key}
+            self.next_slot = len(self.slots) % self.disk_size
+            logger.debug(f"Loaded {len(self.slots)} cached embeddings from {vectors_path}")
+        elif dimensions is not None:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            self.vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32,
+                                                     shape=(self.disk_size, dimensions))
+            self.keys = np.lib.format.open_memmap(keys_path, mode='w+', dtype=self.KEY_DTYPE,
+                                                  shape=(self.disk_size,))
+
+    def lookup(self, key: bytes) -> Optional[np.ndarray]:
+        """Get a cached embedding, promoting an embedding found on disk into memory."""
+        embedding = self.entries.get(key)
+        if embedding is not None:
+            self.entries.move_to_end(key)
+            return embedding
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        embedding = np.array(self.vectors[slot])
+        self.remember(key, embedding)
+        return embedding
+
+    def remember(self, key: bytes, embedding: np.ndarray):
+        """Add an embedding to the in-memory LRU."""
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def store(self, key: bytes, embedding: np.ndarray):
+        """Add an embedding to the in-memory LRU and to the memmap, called with the lock held."""
+        self.remember(key, embedding)
+        # another thread that missed on the same text may have stored it already, a second slot for the key
+        # would later be evicted together with the slots entry that points at the first one
+        if not self.persist_dir or key in self.slots:
+            return
+        if self.vectors is None:
+            self.open_memmap(len(embedding))
+        if self.vectors.shape[1] != len(embedding):
+            return
+        slot = self.next_slot
+        evicted = self.keys[slot]
+        if evicted:
+            self.slots.pop(bytes(evicted), None)
+        self.vectors[slot] = embedding
+        self.keys[slot] = key
+        self.slots[key] = slot
+        self.next_slot = (slot + 1) % self.disk_size
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, only running the wrapped function for texts that are not cached.
+        Args:
+            texts: List[str]: The texts.
+        Returns:
+            List[List[float]]: The embedding of each text."""
+        keys = [self.key(text) for text in texts]
+        embeddings: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self.lock:
+            misses: Dict[bytes, str] = {}
+            for index, key in enumerate(keys):
+                embeddings[index] = self.lookup(key)
+                if embeddings[index] is None:
+                    misses.setdefault(key, texts[index])
+        if misses:
+            computed = self.embedding_function(list(misses.values()))
+            embedded = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in zip(misses, computed)}
+            with self.lock:
+                for key, embedding in embedded.items():
+                    self.store(key, embedding)
+            embeddings = [embedded[key] if embedding is None else embedding
+                          for key, embedding in zip(keys, embeddings)]
+        return [embedding.tolist() for embedding in embeddings]
+
+    def flush(self):
+        """Write the memmap to disk."""
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+                self.keys.flush()
@@ -0,0 +1,173 @@
+from datetime import datetime
+from typing import List, Optional
+import numpy as np
+from alara.config.config import cfg
+from alara.lib.logger import logger
+from alara.lib.cancellation import CancellationToken
+from alara.tools.memory.chroma.chroma import ChromaDBClient, MemoryType, COLLECTION_NAME
+from alara.tools.scheduler import SchedulerManager
+
+SUMMARY_PROMPT = """You are Alara's memory. You are given related memories collected over time, one per line.
+Condense them into a single memory that keeps every fact, preference and event worth remembering.
+Reply with the condensed memory only."""
+
+
+class MemoryCompactor:
+    """Keeps the memory collection small by compacting old memories.
+    Old memories are clustered greedily by cosine similarity of their embeddings. Within a cluster, near-duplicates of
+    the cluster's oldest memory are merged into the newest of them, and clusters that still hold several memories are
+    summarized into a single knowledge memory by the LLM. The originals are deleted, the memories of a cluster whose
+    summary failed are all kept.
+    Memories older than the age budget are compacted, and when the collection exceeds the size budget, the oldest
+    memories over the budget are compacted regardless of their age.
+    Attributes:
+        client: ChromaDBClient: The memory store, the process-wide store if None.
+        collection_name: str: The name of the collection to compact.
+        min_age: float: The number of seconds after which a memory is compacted.
+        max_memories: int: The number of memories the collection may hold before the oldest are compacted.
+        batch_size: int: The maximum number of memories compacted per run, oldest first.
+        cluster_threshold: float: The minimum cosine similarity of a memory to the oldest memory of its cluster.
+        duplicate_threshold: float: The minimum cosine similarity for memories to be merged without summarizing.
+        max_cluster_size: int: The maximum number of memories summarized together.
+        max_cluster_chars: int: The maximum length of the memories summarized together, so that they fit in the
+            context of the LLM. The memories of a cluster over the budget are left to the following clusters.
+        cancel_token: CancellationToken: Stops the summary in progress, independent of the turns of the agent.
+    Summaries run on the LLM the agent answers with and hold its lock, so a turn that starts during a compaction
+    waits for the summary in progress. Keep the batch size small enough for a run to finish quickly."""
+    JOB_ID = "MEMORY_COMPACTION"
+
+    def __init__(self, client: Optional[ChromaDBClient] = None, collection_name: str = COLLECTION_NAME,
+                 min_age: float = cfg.MEMORY_COMPACTION_MIN_AGE * 24 * 3600,
+                 max_memories: int = cfg.MEMORY_MAX_SIZE, batch_size: int = cfg.MEMORY_COMPACTION_BATCH,
+                 cluster_threshold: float = 0.75, duplicate_threshold: float = 0.95, max_cluster_size: int = 20,
+                 max_cluster_chars: int = cfg.LLAMA_N_CTX * 2):
+        self.client = client
+        self.collection_name = collection_name
+        self.min_age = min_age
+        self.max_memories = max_memories
+        self.batch_size = batch_size
+        self.cluster_threshold = cluster_threshold
+        self.duplicate_threshold = duplicate_threshold
+        self.max_cluster_size = max_cluster_size
+        self.max_cluster_chars = max_cluster_chars
+        self.cancel_token = CancellationToken()
+
+    def schedule(self, interval_hours: float = cfg.MEMORY_COMPACTION_INTERVAL):
+        """Run the compaction periodically through the scheduler.
+        Runs never overlap, and runs missed while one was still going are merged into a single run.
+        Args:
+            interval_hours: float: The number of hours between runs."""
+        SchedulerManager().add_job(job_function=self.compact, job_id=self.JOB_ID, trigger="interval",
+                                   hours=interval_hours, max_instances=1, coalesce=True)
+
+    def select_candidates(self, client: ChromaDBClient) -> List[str]:
+        """Select the memories to compact from the age and size budgets.
+        Args:
+            client: ChromaDBClient: The memory store.
+        Returns:
+            List[str]: The ids of the memories to compact, oldest first."""
+        with client.lock:
+            records = client.get_collection(self.collection_name).get(include=['metadatas'])
+        ids = records['ids']
+        if not ids:
+            return []
+        created_at = np.fromiter((client.created_at(metadata) for metadata in records['metadatas']),
+                                 dtype=np.float64, count=len(ids))
+        order = np.argsort(created_at, kind='stable')
+        selected = created_at[order] <= datetime.now().timestamp() - self.min_age
+        selected[:max(len(ids) - self.max_memories, 0)] = True
+        return [ids[i] for i in order[selected][:self.batch_size]]
+
+    def cluster(self, embeddings: np.ndarray, lengths: np.ndarray) -> tuple[List[np.ndarray], np.ndarray]:
+        """Cluster memories greedily, each cluster grows around the oldest memory not yet clustered.
+        Args:
+            embeddings: np.ndarray: The embeddings of the memories, oldest first.
+            lengths: np.ndarray: The number of characters of each memory.
+        Returns:
+            tuple: The indices of the memories of each cluster in age order, and the cosine similarity matrix."""
+        normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        similarities = normalized @ normalized.T
+        unclustered = np.ones(len(embeddings), dtype=bool)
+        clusters = []
+        for leader in range(len(embeddings)):
+            if not unclustered[leader]:
+                continue
+            # every older memory is already clustered, so the leader comes first
+            members = np.flatnonzero(unclustered & (similarities[leader] >= self.cluster_threshold))
+            members = members[:self.max_cluster_size]
+            # the leader is always kept, so a memory over the budget on its own forms a cluster that is skipped
+            within_budget = np.cumsum(lengths[members]) <= self.max_cluster_chars
+            within_budget[0] = True
+            members = members[within_budget]
+            unclustered[members] = False
+            clusters.append(members)
+        return clusters, similarities
+
+    def summarize(self, documents: List[str]) -> Optional[str]:
+        """Summarize a cluster of memories with the LLM.
+        Args:
+            documents: List[str]: The memories, oldest first.
+        Returns:
+            str | None: The summary, None if the LLM failed."""
+        from alara.llm.llm_engine import LlmEngine
+        try:
+            summary = LlmEngine.load_llm().chat_completion(system_prompt=SUMMARY_PROMPT,
+                                                           user_prompt="\n".join(documents),
+                                                           cancel_token=self.cancel_token,
+                                                           cache_prefix=False).strip()
+        except Exception as e:
+            logger.error(f"Failed to summarize memories: {e}")
+            return None
+        # the LLM wrappers report exhausted retries as text
+        if not summary or summary.startswith("Model failed to generate output"):
+            return None
+        return summary
+
+    def compact(self):
+        """Compact the old memories of the collection."""
+        client = self.client if self.client is not None else ChromaDBClient()
+        candidates = self.select_candidates(client)
+        if len(candidates) < 2:
+            return
+        with client.lock:
+            records = client.get_collection(self.collection_name).get(
+                ids=candidates, include=['documents', 'metadatas', 'embeddings'])
+        # get does not preserve the order of the requested ids
+        position = {memory_id: index for index, memory_id in enumerate(records['ids'])}
+        order = [position[memory_id] for memory_id in candidates if memory_id in position]
+        ids = [records['ids'][i] for i in order]
+        documents = [records['documents'][i] for i in order]
+        metadatas = [records['metadatas'][i] for i in order]
+        embeddings = np.asarray(records['embeddings'], dtype=np.float32)[order]
+
+        deleted: List[str] = []
+        summaries: List[str] = []
+        summary_metadatas: List[dict] = []
+        lengths = np.fromiter((len(document) for document in documents), dtype=np.int64, count=len(documents))
+        clusters, similarities = self.cluster(embeddings, lengths)
+        for members in clusters:
+            if len(members) < 2:
+                continue
+            duplicates = members[similarities[members[0], members] >= self.duplicate_threshold]
+            # keep the newest of the near-duplicates, it is the last one since memories are sorted by age
+            remaining = np.concatenate([members[~np.isin(members, duplicates)], duplicates[-1:]])
+            if len(remaining) < 2:
+                deleted.extend(ids[i] for i in duplicates[:-1])
+                continue
+            summary = self.summarize([documents[i] for i in np.sort(remaining)])
+            if summary is None:
+                continue
+            deleted.extend(ids[i] for i in duplicates[:-1])
+            newest = metadatas[int(remaining.max())]
+            summaries.append(summary)
+            summary_metadatas.append({'memory_type': MemoryType.KNOWLEDGE.value,
+                                      'source': 'memory compaction',
+                                      'timestamp': newest.get('timestamp', ''),
+                                      'created_at': client.created_at(newest)})
+            deleted.extend(ids[i] for i in remaining)
+
+        client.add_documents(summaries, summary_metadatas, self.collection_name)
+        if deleted:
+            with client.lock:
+                client.get_collection(self.collection_name).delete(ids=deleted)
+        logger.info(f"Memory compaction removed {len(deleted)} memories and added {len(summaries)} summaries.")
@@ -0,0 +1,118 @@
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import List, Optional
+from alara.config.config import cfg
+from alara.lib.logger import logger
+from alara.lib.singleton import Singleton
+from alara.tools.memory.chroma.chroma import ChromaDBClient, Memory, COLLECTION_NAME
+from alara.tools.text_parser.text_splitter import split_text
+
+FLUSH = object()  # Queued to write the pending batch immediately
+CLOSE = object()  # Queued to write the pending batch and stop the worker
+
+
+class MemoryWriter(metaclass=Singleton):
+    """Write-behind queue for memory ingestion.
+    Memories are split into chunks and queued, a background worker embeds the queued chunks in batches with a single
+    encode call and inserts them with a single add per collection, once the batch is full or the oldest queued chunk
+    has waited for the flush interval. Writes are taken off the user-facing path, at the cost of a queued memory only
+    becoming searchable after its batch has been flushed.
+    Attributes:
+        client: ChromaDBClient: The memory store.
+        batch_size: int: The maximum number of chunks written at once.
+        flush_interval: float: The maximum number of seconds a chunk waits before it is written.
+        pending: queue.Queue: The queued (collection name, chunk, metadata) items.
+        closed: bool: Whether the writer has been closed, flushing a closed writer returns at once."""
+
+    def __init__(self, client: Optional[ChromaDBClient] = None, batch_size: int = cfg.MEMORY_BATCH_SIZE,
+                 flush_interval: float = cfg.MEMORY_FLUSH_INTERVAL):
+        self.client = client if client is not None else ChromaDBClient()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: queue.Queue = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self.run_worker, daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    def enqueue_text(self, text: str, metadata: Optional[dict] = None, collection_name: str = COLLECTION_NAME):
+        """Queue a text to be stored.
+        Args:
+            text: str: The text, split into chunks before it is queued.
+            metadata: dict: The metadata stored with every chunk.
+            collection_name: str: The name of the collection."""
+        metadata = {**self.client.timestamp_metadata(), **(metadata or {})}
+        for chunk in split_text(text):
+            self.pending.put((collection_name, chunk, metadata))
+
+    def enqueue_memory(self, memory: Memory):
+        """Queue a memory to be stored in the memory collection.
+        Args:
+            memory: Memory: The memory."""
+        self.enqueue_text(memory.content, self.client.memory_metadata(memory))
+
+    def write(self, batch: List[tuple]):
+        """Embed and insert a batch of chunks, grouped by collection.
+        Args:
+            batch: List[tuple]: The (collection name, chunk, metadata) items."""
+        collections = defaultdict(lambda: ([], []))
+        for collection_name, chunk, metadata in batch:
+            documents, metadatas = collections[collection_name]
+            documents.append(chunk)
+            metadatas.append(metadata)
+        for collection_name, (documents, metadatas) in collections.items():
+            try:
+                self.client.add_documents(documents, metadatas, collection_name)
+                logger.debug(f"Stored {len(documents)} memory chunks in {collection_name}")
+            except Exception as e:
+                logger.error(f"Failed to store {len(documents)} memory chunks: {e}")
+
+    def run_worker(self):
+        """Collect queued chunks into batches and write them."""
+        running = True
+        while running:
+            item = self.pending.get()
+            batch = []
+            received = 1
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is CLOSE:
+                    running = False
+                    break
+                if item is FLUSH:
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=remaining)
+                    received += 1
+                except queue.Empty:
+                    break
+            if batch:
+                self.write(batch)
+            for _ in range(received):
+                self.pending.task_done()
+
+    def flush(self):
+        """Write the queued chunks now and wait until they have been stored, return at once if the writer is closed."""
+        with self.lock:
+            if self.closed:
+                return
+            # queued before a concurrent close queues CLOSE, so the worker still drains it
+            self.pending.put(FLUSH)
+        self.pending.join()
+
+    def close(self):
+        """Write the queued chunks and stop the worker."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.pending.put(CLOSE)
+        self.worker.join()
@@ -1,6 +1,9 @@
-from typing import Any, Generator
+import re
+from typing import Any, Generator, Iterable
 from nltk.tokenize import sent_tokenize
 
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+
 def split_text(text: str, max_length: int=4000) -> Generator[str, None, None]: 
     chunks =  sent_tokenize(text)
     current_length = 0
@@ -15,7 +18,29 @@ def split_text(text: str, max_length: int=4000) -> Generator[str, None, None]:
             current_length = len(chunk) + 1
     if current_chunk:
         yield " ".join(current_chunk)
-            
+
+
+
+def split_sentences_from_stream(tokens: Iterable[str], min_length: int=20) -> Generator[str, None, None]:
+    """Group a stream of tokens into sentences, yielding each sentence as soon as it is complete.
+    Sentences shorter than min_length are merged with the next one to avoid choppy speech.
+    Args:
+        tokens (Iterable[str]): The streamed tokens.
+        min_length (int): The minimum length of a yielded sentence.
+    Yields:
+        str: The completed sentences."""
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            if match.start() - start >= min_length:
+                yield buffer[start:match.start()].strip()
+                start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
 
 if __name__ == "__main__":
     text = """It is a long established fact that a reader will be distracted by the readable content of a page when looking at its layout.
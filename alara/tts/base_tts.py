@@ -1,18 +1,33 @@
 from abc import ABC, ABCMeta, abstractmethod
 import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Iterable, Optional
+from alara.tools.text_parser.text_splitter import split_sentences_from_stream
+from alara.lib.cancellation import CancellationToken
 
 
 class SingletonMeta(ABCMeta):
-    """Singleton metaclass."""
+    """Singleton metaclass, creation is double-checked under a lock per class like alara.lib.singleton.Singleton."""
     _instances = {}
+    _locks = {}
+    _locks_lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
-        return cls._instances[cls]
+        if cls not in SingletonMeta._instances:
+            with SingletonMeta._locks_lock:
+                lock = SingletonMeta._locks.setdefault(cls, threading.Lock())
+            with lock:
+                if cls not in SingletonMeta._instances:
+                    SingletonMeta._instances[cls] = super().__call__(*args, **kwargs)
+        return SingletonMeta._instances[cls]
 
 
 class BaseTTS(ABC, metaclass=SingletonMeta):
+    # Stops the speech in progress when cancelled. Replaced with a fresh token for every turn.
+    cancel_token: CancellationToken = CancellationToken()
+
     def __init__(self):
         if not os.path.exists('alara/tts/outputs'):
             os.makedirs('alara/tts/outputs')
@@ -24,5 +39,46 @@ class BaseTTS(ABC, metaclass=SingletonMeta):
     @abstractmethod
     def synthesize_to_file(self, text: str, output_dir: str, output_filename: str):
         pass
-    
 
+    def enqueue(self, text: str) -> Optional[Future]:
+        """Speak text as part of a stream. Engines with a playback queue return without waiting.
+        Args:
+            text: The text to synthesize.
+        Returns:
+            Future | None: Resolved once the text has been spoken, None if it already has."""
+        self.synthesize(text)
+        return None
+
+    def synthesize_stream(self, tokens: Iterable[str]) -> str:
+        """Synthesize a stream of tokens sentence by sentence.
+        The tokens are consumed on a background thread, so generation continues while
+        the finished sentences are being spoken.
+        Args:
+            tokens: The streamed tokens, eg. from an LLM.
+        Returns:
+            str: The text that was synthesized, which stops short if the cancellation token is cancelled."""
+        cancel_token = self.cancel_token
+        sentences: queue.Queue = queue.Queue()
+        spoken = []
+        pending = []
+
+        def produce():
+            try:
+                for sentence in split_sentences_from_stream(tokens):
+                    sentences.put(sentence)
+            finally:
+                sentences.put(None)
+
+        threading.Thread(target=produce, daemon=True).start()
+        while (sentence := sentences.get()) is not None:
+            # keep draining after a cancellation, the generator stops on the same token
+            if cancel_token.cancelled:
+                continue
+            spoken.append(sentence)
+            queued = self.enqueue(sentence)
+            if queued is not None:
+                pending.append(queued)
+        # the sentences play in order, waiting on each surfaces the first error
+        for queued in pending:
+            queued.result()
+        return " ".join(spoken)
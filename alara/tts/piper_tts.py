@@ -1,9 +1,18 @@
 import subprocess
+import json
+import os
+import queue
 import re
+import threading
+import wave
+from collections import deque
+from concurrent.futures import Future
+from uuid import uuid4
 from .base_tts import BaseTTS
 from alara.config.config import cfg
 from alara.tools.text_parser.format_en import Converter
 from alara.lib.logger import logger
+from alara.lib.cancellation import CancellationToken
 
 class PiperTTSError(Exception):
     def __init__(self, message: str) -> None:
@@ -30,6 +39,18 @@ class PiperTTS(BaseTTS):
             "noise_w": 0.8,
             "sentence_silence": 0.1,
         }
+        self.process = None
+        self.audio = None
+        self.stream = None
+        self.stream_format = None
+        self.utterances: queue.Queue = queue.Queue()
+        self.playback: queue.Queue = queue.Queue()
+        self.cancel_token = CancellationToken()
+        self.stderr_tail: deque = deque(maxlen=20)
+        self.worker = None
+        self.player = None
+        self.worker_lock = threading.Lock()
+        self.ensure_worker()
         logger.info("Piper TTS initialized.")
         
     def clean_text(self, text: str):
@@ -58,43 +79,169 @@ class PiperTTS(BaseTTS):
         cleaned_text = converter.convert_in_text(cleaned_text)
         return cleaned_text
     
-    def synthesize(self, text: str):
-        cleaned_text = self.clean_text(text)
-        process = subprocess.Popen(
+    def start_process(self) -> subprocess.Popen:
+        """Start a piper process that keeps the voice model loaded and reads utterances as JSON lines."""
+        logger.info("Starting Piper worker process...")
+        os.makedirs('alara/tts/outputs', exist_ok=True)
+        return subprocess.Popen(
             [
                 self.piper_path,
                 '--model', self.model_path,
-                '--output_file', self.output_file,
+                '--json-input',
+                '--output_dir', os.path.abspath('alara/tts/outputs'),
                 '--sentence_silence', str(self.params['sentence_silence']),
                 '--noise_scale', str(self.params['noise_scale']),
                 '--length_scale', str(self.params['length_scale']),
                 '--noise_w', str(self.params['noise_w']),
-                '--output-raw'
             ],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            text=False,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
         )
-        
-        if process.stdin is None or process.stdout is None:
+
+    def read_stderr(self, process: subprocess.Popen):
+        """Log the output of a piper process and keep its last lines for error messages."""
+        for line in process.stderr:
+            line = line.rstrip()
+            if line:
+                self.stderr_tail.append(line)
+                logger.debug(f"Piper: {line}")
+
+    def process_error(self, message: str) -> PiperTTSError:
+        """Build an error that includes the last lines piper wrote to stderr."""
+        if self.stderr_tail:
+            message = f"{message}: " + " | ".join(self.stderr_tail)
+        return PiperTTSError(message)
+
+    def synthesize_utterance(self, text: str) -> str:
+        """Synthesize an utterance with the piper process, restarting it if it has exited.
+        Args:
+            text: The cleaned text to synthesize.
+        Returns:
+            str: The path of the synthesized audio file."""
+        if self.process is None or self.process.poll() is not None:
+            self.stderr_tail.clear()
+            self.process = self.start_process()
+            threading.Thread(target=self.read_stderr, args=(self.process,), daemon=True).start()
+        if self.process.stdin is None or self.process.stdout is None:
             raise PiperTTSError("Failed to create subprocess")
-        
+        output_file = os.path.abspath(f"alara/tts/outputs/{uuid4().hex}.wav")
+        try:
+            self.process.stdin.write(json.dumps({"text": text, "output_file": output_file}) + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            raise self.process_error(f"Piper process is not accepting input ({e})")
+        # piper prints the path of each audio file once it has been written
+        output_file = self.process.stdout.readline().strip()
+        if not output_file:
+            raise self.process_error("Piper process exited unexpectedly")
+        return output_file
+
+    def play_file(self, audio_path: str, cancel_token: CancellationToken):
+        """Play an audio file on the shared output stream, then delete it.
+        The stream is kept open across utterances and only reopened if the audio format changes.
+        Playback stops within a chunk once the cancellation token is cancelled.
+        Args:
+            audio_path: The path to the audio file.
+            cancel_token: The token of the utterance."""
         import pyaudio
         chunk = 1024
-        p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio.paInt16,
-                        channels=1,
-                        rate=22050,
-                        output=True)
-        process.stdin.write(cleaned_text.encode())
-        process.stdin.close()
-        data = process.stdout.read(chunk)
-        while len(data) > 0:
-            stream.write(data)
-            data = process.stdout.read(chunk)
-        stream.close()
-        process.wait()
-        p.terminate()
+        try:
+            with wave.open(audio_path, 'rb') as wf:
+                stream_format = (wf.getsampwidth(), wf.getnchannels(), wf.getframerate())
+                if self.stream is None or self.stream_format != stream_format:
+                    if self.stream is not None:
+                        self.stream.close()
+                    if self.audio is None:
+                        self.audio = pyaudio.PyAudio()
+                    self.stream = self.audio.open(format=self.audio.get_format_from_width(stream_format[0]),
+                                                  channels=stream_format[1],
+                                                  rate=stream_format[2],
+                                                  output=True)
+                    self.stream_format = stream_format
+                data = wf.readframes(chunk)
+                while len(data) > 0 and not cancel_token.cancelled:
+                    self.stream.write(data)
+                    data = wf.readframes(chunk)
+        finally:
+            os.remove(audio_path)
+
+    def ensure_worker(self):
+        """Start the synthesis and playback threads, or restart them if they have exited."""
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run_worker, daemon=True)
+                self.worker.start()
+            if self.player is None or not self.player.is_alive():
+                self.player = threading.Thread(target=self.run_player, daemon=True)
+                self.player.start()
+
+    @staticmethod
+    def fail(done: Future, error: Exception):
+        """Report an error to the caller waiting for an utterance."""
+        logger.error(f"Error synthesizing speech: {error}")
+        done.set_exception(error if isinstance(error, PiperTTSError) else PiperTTSError(str(error)))
+
+    def run_worker(self):
+        """Synthesize the queued utterances one after another and hand them to the player, skipping cancelled ones.
+        The next utterance is synthesized while the previous one plays."""
+        while True:
+            text, done, cancel_token = self.utterances.get()
+            try:
+                if cancel_token.cancelled:
+                    done.set_result(None)
+                    continue
+                self.playback.put((self.synthesize_utterance(text), done, cancel_token))
+            except Exception as e:
+                self.fail(done, e)
+
+    def run_player(self):
+        """Play the synthesized utterances in order.
+        The outcome of each utterance is set on its future, so errors reach the caller waiting for it."""
+        while True:
+            audio_path, done, cancel_token = self.playback.get()
+            try:
+                if cancel_token.cancelled:
+                    os.remove(audio_path)
+                else:
+                    self.play_file(audio_path, cancel_token)
+                done.set_result(None)
+            except Exception as e:
+                self.fail(done, e)
+
+    def synthesize(self, text: str, block: bool = True) -> Future:
+        """Queue text to be spoken by the Piper worker.
+        Args:
+            text: The text to synthesize.
+            block: Whether to wait until the text has been spoken or the cancellation token is cancelled.
+        Returns:
+            Future: Resolved once the text has been spoken or skipped.
+        Raises:
+            PiperTTSError: If blocking and the text could not be synthesized or played."""
+        done = Future()
+        self.ensure_worker()
+        self.utterances.put((self.clean_text(text), done, self.cancel_token))
+        if block:
+            done.result()
+        return done
+
+    def enqueue(self, text: str) -> Future:
+        """Queue text without waiting for it, so piper synthesizes the next sentence while this one plays."""
+        return self.synthesize(text, block=False)
+
+    def close(self):
+        """Stop the piper process and close the output stream."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+        self.process = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
         
     def synthesize_to_file(self, output_dir: str='alara/tts/outputs', output_filename: str='output', text: str=''):
         cleaned_text = self.clean_text(text)
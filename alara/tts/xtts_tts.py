@@ -1,12 +1,16 @@
 # Description: This file contains the code for the TextToSpeechSystem class.
+import hashlib
 import os
+import threading
 import wave
+import torch
 from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
 import soundfile as sf
 from alara.lib.logger import logger
 from alara.tts.base_tts import BaseTTS
 from alara.config.config import cfg
+from alara.lib.cancellation import CancellationToken
 
 
 class XttsTTS(BaseTTS):
@@ -19,17 +23,59 @@ class XttsTTS(BaseTTS):
         vocab_path: The path to the vocabulary file.
         speaker_path: The path to the speaker file.
         model_dir: The path to the model directory.
-        model: The model to use for text to speech."""
+        model: The model to use for text to speech, loaded on first use and kept resident.
+        gpt_cond_latent: The conditioning latent of the speaker.
+        speaker_embedding: The embedding of the speaker.
+        cancel_token: Stops the speech in progress when cancelled."""
     def __init__(self):
         self.config = XttsConfig()
         self.config.load_json(cfg.XTTS_CONFIG_PATH)
         self.vocab_path = cfg.XTTS_VOCAB_PATH
         self.speaker_path = cfg.XTTS_SPEAKER_PATH
         self.model_dir = cfg.XTTS_MODEL_DIR
+        self.model = None
+        self.gpt_cond_latent = None
+        self.speaker_embedding = None
+        self.lock = threading.Lock()
+        self.cancel_token = CancellationToken()
         logger.info("TextToSpeechSystem initialized.")
         # make sure the output directory exists
         
 
+    def load_model(self) -> Xtts:
+        """Load the model checkpoint and the speaker latents once and keep them resident.
+        Returns:
+            Xtts: The loaded model."""
+        with self.lock:
+            if self.model is None:
+                model = Xtts.init_from_config(self.config)
+                logger.info("Loading model checkpoint...")
+                model.load_checkpoint(config=self.config,
+                                      checkpoint_dir=self.model_dir,
+                                      vocab_path=self.vocab_path)
+                self.gpt_cond_latent, self.speaker_embedding = self.load_conditioning_latents(model)
+                self.model = model
+        return self.model
+
+    def load_conditioning_latents(self, model: Xtts):
+        """Load the speaker conditioning latents, computing and caching them next to the speaker file on a miss.
+        The cache file is keyed by the hash of the speaker file, so replacing the sample recomputes the latents.
+        Args:
+            model: The loaded model.
+        Returns:
+            tuple: The gpt conditioning latent and the speaker embedding."""
+        with open(self.speaker_path, "rb") as file:
+            speaker_hash = hashlib.sha256(file.read()).hexdigest()[:16]
+        latents_path = f"{os.path.splitext(self.speaker_path)[0]}.{speaker_hash}.latents.pt"
+        if os.path.exists(latents_path):
+            logger.info("Loading cached speaker latents...")
+            latents = torch.load(latents_path)
+            return latents["gpt_cond_latent"], latents["speaker_embedding"]
+        logger.info("Computing speaker latents...")
+        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(audio_path=[self.speaker_path])
+        torch.save({"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding}, latents_path)
+        return gpt_cond_latent, speaker_embedding
+
     def load_txt_from_file(self, file_path) -> str:
         """Load text from a file.
         Args:
@@ -61,15 +107,37 @@ class XttsTTS(BaseTTS):
         except Exception as e:
             logger.error(f"Error playing audio: {e}")
                         
-    def synthesize(self,text: str, output_dir: str='alara/tts/outputs', output_filename: str='output.wav'):
-        """synthesize the text, play the audio, and then delete the audio file.
+    def synthesize(self, text: str):
+        """synthesize the text and play the audio chunks as they are generated.
+        Synthesis and playback stop after the current chunk once the cancellation token is cancelled.
         Args:
-            text: The text to synthesize.
-            output_dir: The directory to output the synthesized text to.
-            output_filename: The name of the output file."""
-        self.synthesize_to_file(text,output_dir,output_filename)
-        self.play_audio(f"{output_dir}/{output_filename}")
-        os.remove(f"{output_dir}/{output_filename}")
+            text: The text to synthesize."""
+        import pyaudio
+        cancel_token = self.cancel_token
+        model = self.load_model()
+        logger.info("Streaming synthesis...")
+        p = pyaudio.PyAudio()
+        stream = p.open(format=pyaudio.paFloat32,
+                        channels=1,
+                        rate=24000,
+                        output=True)
+        try:
+            chunks = model.inference_stream(
+                text,
+                "en",
+                self.gpt_cond_latent,
+                self.speaker_embedding,
+                enable_text_splitting=True
+            )
+            for chunk in chunks:
+                if cancel_token.cancelled:
+                    logger.info("Synthesis cancelled.")
+                    break
+                stream.write(chunk.squeeze().cpu().numpy().astype("float32").tobytes())
+        finally:
+            stream.close()
+            p.terminate()
+        logger.info("Synthesis complete.")
         
         
     def synthesize_to_file(self,text: str, output_dir: str='alara/tts/outputs', output_filename: str='output.wav'):
@@ -78,27 +146,14 @@ class XttsTTS(BaseTTS):
             text: The text to synthesize.
             output_dir: The directory to output the synthesized text to.
             output_filename: The name of the output file."""
-        self.model = Xtts.init_from_config(self.config)
-        logger.info("Loading model checkpoint...")
-        self.model.load_checkpoint(config=self.config,
-                                   checkpoint_dir=self.model_dir,
-                                   vocab_path=self.vocab_path)
-        gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
-                audio_path=[self.speaker_path]
-            )
+        model = self.load_model()
         logger.info("Synthesizing text...")
-        out = self.model.inference(
+        out = model.inference(
                 text=text,
-                gpt_cond_latent=gpt_cond_latent,
-                speaker_embedding=speaker_embedding,
+                gpt_cond_latent=self.gpt_cond_latent,
+                speaker_embedding=self.speaker_embedding,
                 language="en",
                 enable_text_splitting=True
             )
         logger.info("Synthesis complete.")
         sf.write(f"{output_dir}/{output_filename}", out["wav"], 24000)
-        
-        
-        
- 
- 
- 
@@ -1,5 +1,5 @@
 from alara.agent.agent import Agent
+from alara.agent.runtime import AgentRuntime
 
 agent = Agent()
-agent.run()
-
+AgentRuntime(agent).run()